@@ -0,0 +1,405 @@
+"""
+Offline benchmark for the profile API and refresh pipeline.
+
+Local stub servers stand in for Discord REST and the Roblox APIs, so the
+run needs no token and sends nothing off the machine. Everything happens in
+a scratch directory, so real profile files are never touched.
+
+Measures:
+- requests/sec and p50/p99 latency of the /api/profile routes under N
+  concurrent clients, with and without conditional requests (If-None-Match)
+- wall time of a full refresh of every tracked account, with configurable
+  upstream latency
+- memory retained per tracked account
+
+Usage:
+    python bench_profile_api.py --accounts 50 --clients 32 --output bench.json
+    python bench_profile_api.py --compare bench.json  # run again and show the change
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTES = (
+    "/api/profile",
+    "/api/profile/discord",
+    "/api/profile/roblox",
+    "/api/profile?fields=discord.avatar_url,roblox.followers_count",
+)
+ROBLOX_HOSTS = ("users.roblox.com", "thumbnails.roblox.com", "friends.roblox.com")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * (len(samples) - 1) + 0.5))]
+
+
+# ==================== STUB UPSTREAMS ====================
+
+class StubUpstreams:
+    """One aiohttp app answering like Discord REST and the Roblox APIs.
+
+    Every handler waits ``latency`` seconds first, standing in for the
+    network round trip, and counts the request.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.requests = 0
+        self.runner: web.AppRunner = None
+        self.base = ""
+        self.app = web.Application()
+        self.app.router.add_get("/api/v10/users/{user_id}", self.discord_user)
+        self.app.router.add_post("/v1/users", self.roblox_users)
+        # Before /v1/users/{user_id}, which would match it too
+        self.app.router.add_get("/v1/users/avatar-headshot", self.roblox_headshots)
+        self.app.router.add_get("/v1/users/{user_id}", self.roblox_user)
+        self.app.router.add_get("/v1/users/{user_id}/{kind}/count", self.roblox_count)
+
+    async def _respond(self, payload) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        # Exactly "application/json": discord.py leaves a body with a charset
+        # parameter as text, so fetch_user would fail on json_response()
+        return web.Response(body=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+
+    async def discord_user(self, request: web.Request) -> web.Response:
+        user_id = request.match_info["user_id"]
+        if user_id == "@me":
+            user_id = "1"
+        return await self._respond({
+            "id": user_id,
+            "username": f"user{user_id}",
+            "global_name": f"User {user_id}",
+            "discriminator": "0",
+            "avatar": None,
+            "banner": None,
+            "accent_color": None,
+            "bot": user_id == "1",
+            "public_flags": 0,
+        })
+
+    async def roblox_users(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return await self._respond({"data": [
+            {"id": user_id, "name": f"rbx{user_id}", "displayName": f"Rbx {user_id}", "hasVerifiedBadge": False}
+            for user_id in body.get("userIds", [])
+        ]})
+
+    async def roblox_headshots(self, request: web.Request) -> web.Response:
+        ids = [int(user_id) for user_id in request.query.get("userIds", "").split(",") if user_id]
+        return await self._respond({"data": [
+            {"targetId": user_id, "state": "Completed", "imageUrl": f"https://tr.rbxcdn.com/{user_id}/420/420/Png"}
+            for user_id in ids
+        ]})
+
+    async def roblox_user(self, request: web.Request) -> web.Response:
+        user_id = int(request.match_info["user_id"])
+        return await self._respond({
+            "id": user_id,
+            "name": f"rbx{user_id}",
+            "displayName": f"Rbx {user_id}",
+            "description": "Benchmark account",
+            "created": "2015-06-01T00:00:00Z",
+            "isBanned": False,
+        })
+
+    async def roblox_count(self, request: web.Request) -> web.Response:
+        return await self._respond({"count": random.randint(0, 5000)})
+
+    async def start(self):
+        port = free_port()
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", port).start()
+        self.base = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+# ==================== REFRESH ====================
+
+def write_accounts(count: int):
+    """Track ``count`` accounts in total: the default one plus extras from ACCOUNTS_FILE."""
+    entries = [
+        {"id": f"bench{i}", "discord_user_id": 10_000 + i, "roblox_user_id": 20_000 + i}
+        for i in range(1, count)
+    ]
+    with open("accounts.json", "w") as f:
+        json.dump(entries, f)
+
+
+async def bench_refresh(pc, args) -> dict:
+    """Time full refreshes of every account against the stubs."""
+    import discord
+    from discord.ext import commands
+
+    stubs = StubUpstreams(args.upstream_latency / 1000)
+    await stubs.start()
+    for host in ROBLOX_HOSTS:
+        pc.UPSTREAM_OVERRIDES[host] = stubs.base
+    discord.http.Route.BASE = f"{stubs.base}/api/v10"
+    if args.unthrottled:
+        for host in list(pc.HOST_RATE_LIMITS):
+            pc.HOST_RATE_LIMITS[host] = (1e9, 1e9)
+
+    bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+    await bot.http.static_login("bench-token")
+
+    # The API is benchmarked separately; keep the cog from serving it here
+    pc.API_SERVER = "none"
+    cog = pc.ProfileCog(bot)
+    cog.auto_update.cancel()
+
+    runs = []
+    requests = []
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in range(args.refresh_runs):
+        before = stubs.requests
+        started = time.perf_counter()
+        await cog.update_accounts()
+        runs.append(round(time.perf_counter() - started, 4))
+        requests.append(stubs.requests - before)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # The API workers read these files
+    await cog.writer.flush()
+    await cog.http.close()
+    await bot.close()
+    await stubs.stop()
+
+    accounts = len(pc.profile_registry.accounts)
+    return {
+        "refresh": {
+            "accounts": accounts,
+            "upstream_latency_ms": args.upstream_latency,
+            "unthrottled": args.unthrottled,
+            "runs_s": runs,
+            "upstream_requests": requests,
+        },
+        "memory": {
+            "accounts": accounts,
+            # Includes the connection pool and other one-off allocations,
+            # so it overstates the cost of each account at small counts
+            "retained_bytes": retained,
+            "bytes_per_account": retained // accounts,
+        },
+    }
+
+
+# ==================== API ====================
+
+def serve(workdir: str, server: str, port: int):
+    """Child process: serve the profile API from the files in ``workdir``, as profile_api.py does."""
+    os.chdir(workdir)
+    sys.path.insert(0, BOT_DIR)
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    if server == "flask":
+        from profile_api_flask import run_flask
+        run_flask("127.0.0.1", port)
+        return
+
+    from profile_api_aiohttp import AsyncApiServer
+
+    async def run():
+        await AsyncApiServer("127.0.0.1", port).start()
+        await asyncio.Event().wait()
+    asyncio.run(run())
+
+
+async def wait_until_up(base: str, timeout: float = 15):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base}/api/health") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+    raise RuntimeError(f"API server at {base} did not start")
+
+
+async def load(base: str, route: str, clients: int, duration: float, conditional: bool) -> dict:
+    """Hit ``route`` from ``clients`` concurrent clients for ``duration`` seconds."""
+    latencies = []
+    statuses: dict = {}
+    errors = 0
+    deadline = time.perf_counter() + duration
+    connector = aiohttp.TCPConnector(limit=clients)
+
+    async with aiohttp.ClientSession(connector=connector, auto_decompress=True) as session:
+        async def client():
+            nonlocal errors
+            etag = None
+            while time.perf_counter() < deadline:
+                headers = {"Accept-Encoding": "gzip"}
+                if conditional and etag:
+                    headers["If-None-Match"] = etag
+                started = time.perf_counter()
+                try:
+                    async with session.get(base + route, headers=headers) as resp:
+                        await resp.read()
+                        etag = resp.headers.get("ETag", etag)
+                        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "route": route,
+        "conditional": conditional,
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def bench_api(workdir: str, args) -> list:
+    results = []
+    servers = ("flask", "aiohttp") if args.server == "both" else (args.server,)
+    context = multiprocessing.get_context("spawn")
+    for server in servers:
+        port = free_port()
+        process = context.Process(target=serve, args=(workdir, server, port), daemon=True)
+        process.start()
+        try:
+            base = f"http://127.0.0.1:{port}"
+            await wait_until_up(base)
+            for route in ROUTES:
+                for conditional in (False, True):
+                    result = await load(base, route, args.clients, args.duration, conditional)
+                    result["server"] = server
+                    results.append(result)
+                    print(
+                        f"{server:8} {route:62} {'conditional' if conditional else 'full':12}"
+                        f" {result['rps']:>9} req/s  p50 {result['p50_ms']:>7} ms  p99 {result['p99_ms']:>7} ms"
+                    )
+        finally:
+            process.terminate()
+            process.join()
+    return results
+
+
+# ==================== REPORT ====================
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(previous: dict, current: dict):
+    """Print how throughput, latency and refresh time moved since ``previous``."""
+    def change(old, new) -> str:
+        return f"{old} -> {new} ({(new - old) / old * 100:+.1f}%)" if old else f"{old} -> {new}"
+
+    old_api = {(r["server"], r["route"], r["conditional"]): r for r in previous.get("api", [])}
+    print(f"\nCompared with {previous['meta'].get('git_commit') or 'previous run'}:")
+    for result in current["api"]:
+        old = old_api.get((result["server"], result["route"], result["conditional"]))
+        if old:
+            label = f"{result['server']} {result['route']} {'conditional' if result['conditional'] else 'full'}"
+            print(f"  {label}: rps {change(old['rps'], result['rps'])}, p99 {change(old['p99_ms'], result['p99_ms'])}")
+    if "refresh" in previous and "refresh" in current:
+        print(f"  refresh (first run): {change(previous['refresh']['runs_s'][0], current['refresh']['runs_s'][0])} s")
+        print(f"  bytes per account: {change(previous['memory']['bytes_per_account'], current['memory']['bytes_per_account'])}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("flask", "aiohttp", "both"), default="both")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent API clients")
+    parser.add_argument("--duration", type=float, default=3, help="seconds per route and mode")
+    parser.add_argument("--accounts", type=int, default=20, help="tracked accounts, including the default one")
+    parser.add_argument("--upstream-latency", type=float, default=50, help="ms each stub response is delayed")
+    parser.add_argument("--refresh-runs", type=int, default=3)
+    parser.add_argument("--unthrottled", action="store_true", help="lift HOST_RATE_LIMITS for the refresh runs")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="profile-bench-")
+    os.chdir(workdir)
+    write_accounts(args.accounts)
+    sys.path.insert(0, BOT_DIR)
+    import profile_cog as pc
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+    }
+    results.update(asyncio.run(bench_refresh(pc, args)))
+    print(f"refresh of {results['refresh']['accounts']} accounts: {results['refresh']['runs_s']} s")
+    print(f"memory: {results['memory']['bytes_per_account']} bytes per account")
+    results["api"] = asyncio.run(bench_api(workdir, args))
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output}")
+    if previous:
+        compare(previous, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1882 @@
+"""
+Profile data shared by the bot and the API: the tracked accounts, their
+in-memory snapshots, persistence, history, the image cache and the
+HTTP-agnostic parts of the API.
+
+Only the standard library (and python-dotenv, if installed) is imported
+here, so the API can start without loading discord.py. The servers live in profile_api_flask and
+profile_api_aiohttp and are imported only when used.
+
+API only (serves the saved profiles, no Discord login):
+    python profile_api.py [--server flask|aiohttp|workers]
+"""
+
+import json
+import os
+import re
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+from email.utils import formatdate, parsedate_to_datetime
+import gzip
+import hashlib
+import hmac
+import asyncio
+import bisect
+import contextlib
+import logging
+import math
+from collections import OrderedDict, deque
+import io
+import mmap
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    # Before the settings below (and the cog's) read the environment, so they
+    # can live in the same .env as DISCORD_BOT_TOKEN; set variables win
+    load_dotenv()
+
+# Update these with your IDs
+DISCORD_USER_ID = 822804221425614903
+ROBLOX_USER_ID = 1610763045
+DATA_FILE = "profile_data.json"
+API_PORT = 25566
+API_HOST = "0.0.0.0"
+API_SERVER = "flask"  # "flask" (threaded Werkzeug server), "aiohttp" (runs on the bot's event loop), "workers" or "none"
+API_WORKERS = 4  # Processes serving the API when API_SERVER = "workers" (profile, history and health routes only)
+SHARED_SNAPSHOT_FILE = "/dev/shm/profile-api-snapshot" if os.path.isdir("/dev/shm") else "profile-api-snapshot"
+SHARED_SNAPSHOT_SIZE = 16 * 1024 * 1024  # Bytes mapped for the workers' copy of every prepared response
+SHARED_READ_ATTEMPTS = 3  # Tries a request makes to copy a publish the writer isn't in the middle of
+SNAPSHOT_STAT_INTERVAL = 1.0  # Seconds between mtime checks of a profile file
+PERSIST_DEBOUNCE = 2  # Seconds to gather changes to one profile into a single disk write
+STREAM_BUFFER_SIZE = 16  # Events queued per stream client before it is resynced with a full snapshot
+STREAM_HEARTBEAT = 15  # Seconds between keep-alive comments on idle streams
+STREAM_MAX_SUBSCRIBERS = 5000  # Per account
+COMPRESS_MIN_BYTES = 256  # Smaller bodies are sent uncompressed
+PREPARED_CACHE_LIMIT = 64  # Cached encodings/projections per snapshot before new ones stop being kept
+MAX_PROJECTION_FIELDS = 32
+IMAGE_CACHE_DIR = "image_cache"
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Least recently used images are evicted past this
+IMAGE_MAX_DOWNLOAD = 8 * 1024 * 1024  # Largest upstream image we'll cache
+IMAGE_SIZES = (64, 128, 256, 512)  # Allowed ?size= values for resized variants (needs Pillow)
+IMAGE_FETCH_TIMEOUT = 10  # Seconds a request waits for a cache miss to be downloaded
+IMAGE_CACHE_CONTROL = "public, max-age=3600"
+PERSIST_FORMAT = "json"  # "json" (compact) or "msgpack" (binary, needs the msgpack package)
+JSON_BACKEND = "auto"  # Serializer for JSON bodies and files: "json", "orjson" or "auto" (orjson if installed)
+ACCOUNTS_FILE = "accounts.json"  # Extra portfolio owners to track, see load_accounts()
+PROFILES_DIR = "profiles"  # Where data files for the extra accounts are stored
+HISTORY_DB = "profile_history.db"  # SQLite file holding follower/friend counts and status over time
+HISTORY_MAX_POINTS = 500  # Points a history query returns at most; longer ranges are downsampled
+DEFAULT_ACCOUNT_ID = "default"
+RESERVED_ACCOUNT_IDS = {"discord", "roblox", "stream", "history"}
+ACCOUNT_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+API_RATE_LIMIT = (10, 30)  # Per client IP: (requests per second, burst); more get 429
+API_RATE_CLIENTS = 10000  # Client IPs tracked at once; the least recently seen are forgotten past this
+API_RATE_EXEMPT = frozenset({"127.0.0.1", "::1"})  # Local health checks and bench_profile_api.py
+API_TRUSTED_PROXIES = frozenset()  # Reverse proxies whose X-Forwarded-For names the client to rate limit
+API_PROXY_SECRET = os.getenv("PROFILE_API_PROXY_SECRET")  # Requests sending it in X-Proxy-Secret skip API_RATE_LIMIT
+API_MAX_IN_FLIGHT = 64  # Requests handled at once per server process; more get 503
+API_MAX_CONNECTIONS = 256  # Open client connections per server process; more are closed
+LOG_LEVEL = os.getenv("PROFILE_LOG_LEVEL", "INFO")
+
+# Handlers and format come from the entry point: main() here and the cog's
+# __main__ call logging.basicConfig; a bot loading the cog as an extension
+# configures logging itself (discord.py only sets up the "discord" logger)
+log = logging.getLogger("profile_cog")
+log.setLevel(LOG_LEVEL)
+api_log = log.getChild("api")
+
+
+class TrackedAccount(NamedTuple):
+    """One portfolio owner whose Discord and/or Roblox profile we track."""
+    account_id: str
+    discord_user_id: Optional[int]
+    roblox_user_id: Optional[int]
+    data_file: str
+
+
+def load_accounts() -> dict:
+    """Load the tracked accounts, keyed by account id.
+
+    The account built from DISCORD_USER_ID / ROBLOX_USER_ID is always
+    present as DEFAULT_ACCOUNT_ID and keeps using DATA_FILE. ACCOUNTS_FILE
+    may add more as a JSON list of
+    ``{"id": ..., "discord_user_id": ..., "roblox_user_id": ...}`` objects.
+    """
+    accounts = {
+        DEFAULT_ACCOUNT_ID: TrackedAccount(DEFAULT_ACCOUNT_ID, DISCORD_USER_ID, ROBLOX_USER_ID, DATA_FILE)
+    }
+    if not os.path.exists(ACCOUNTS_FILE):
+        return accounts
+
+    try:
+        with open(ACCOUNTS_FILE, 'r') as f:
+            entries = json.load(f)
+    except Exception as e:
+        log.error("Error loading %s: %s", ACCOUNTS_FILE, e)
+        return accounts
+    if not isinstance(entries, list):
+        log.error("Error loading %s: expected a list of accounts", ACCOUNTS_FILE)
+        return accounts
+
+    for entry in entries:
+        if not isinstance(entry, dict):
+            log.warning("Skipping account entry that isn't an object: %r", entry)
+            continue
+        account_id = str(entry.get("id", ""))
+        if not ACCOUNT_ID_RE.match(account_id) or account_id in RESERVED_ACCOUNT_IDS or account_id in accounts:
+            log.warning("Skipping account with invalid or duplicate id: %r", account_id)
+            continue
+        discord_id = entry.get("discord_user_id")
+        roblox_id = entry.get("roblox_user_id")
+        try:
+            discord_id = int(discord_id) if discord_id else None
+            roblox_id = int(roblox_id) if roblox_id else None
+        except (TypeError, ValueError):
+            # One bad entry mustn't stop the bot and the API from starting
+            log.warning("Skipping account %r with an invalid user id: %r / %r", account_id, discord_id, roblox_id)
+            continue
+        accounts[account_id] = TrackedAccount(
+            account_id, discord_id, roblox_id, os.path.join(PROFILES_DIR, f"{account_id}.json"),
+        )
+    return accounts
+
+
+def _file_mtime(path: str) -> Optional[float]:
+    """Return the mtime of ``path``, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+# ==================== PROFILE MODEL ====================
+
+class Struct:
+    """Base for the profile structs: a fixed set of typed ``__slots__`` fields.
+
+    ``FIELDS`` maps each field to the type it holds;
+    None is accepted for any of them. A nested Struct type is decoded
+    recursively. Fields never set stay unset and are left out of
+    ``to_dict()``, so sparse sections (accounts without a Discord user,
+    files from before a field existed) round-trip unchanged. ``bool`` is
+    not accepted for an ``int`` field, although it is a subclass.
+
+    The structs only build profiles: published snapshots stay plain dicts,
+    which is what the ETags, field projection and JSON patches work on.
+    Data that is already a dict is checked with ``validate()`` instead,
+    which doesn't copy it into a struct and back.
+    """
+
+    __slots__ = ()
+    FIELDS: dict = {}
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            self._set(name, value)
+
+    def _set(self, name: str, value):
+        types = self.FIELDS.get(name)
+        if types is None:
+            raise ValueError(f"{type(self).__name__} has no field {name!r}")
+        if isinstance(types, type) and issubclass(types, Struct):
+            if value is not None and not isinstance(value, Struct):
+                value = types.decode(value)
+        elif value is not None:
+            self._check(name, types, value)
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def _check(cls, name: str, types: type, value):
+        if not isinstance(value, types) or (types is int and isinstance(value, bool)):
+            raise ValueError(f"{cls.__name__}.{name}: expected {types.__name__}, got {type(value).__name__}")
+
+    @classmethod
+    def validate(cls, obj) -> dict:
+        """Check a decoded object like ``decode()`` but keep it a dict.
+
+        ``obj`` itself is returned unless unknown keys had to be dropped
+        (here or in a nested section), so valid data is never copied.
+        """
+        if not isinstance(obj, dict):
+            raise ValueError(f"{cls.__name__}: expected an object, got {type(obj).__name__}")
+        result = obj
+        for name, value in obj.items():
+            types = cls.FIELDS.get(name)
+            if types is None:
+                if result is obj:
+                    result = dict(obj)
+                del result[name]
+            elif value is None:
+                continue
+            elif isinstance(types, type) and issubclass(types, Struct):
+                checked = types.validate(value)
+                if checked is not value:
+                    if result is obj:
+                        result = dict(obj)
+                    result[name] = checked
+            else:
+                cls._check(name, types, value)
+        return result
+
+    @classmethod
+    def decode(cls, obj) -> "Struct":
+        """Validate a decoded object into a struct, dropping unknown keys.
+
+        Raises ValueError if ``obj`` isn't a mapping or a field has the
+        wrong type.
+        """
+        if not isinstance(obj, dict):
+            raise ValueError(f"{cls.__name__}: expected an object, got {type(obj).__name__}")
+        struct = cls.__new__(cls)
+        for name in cls.FIELDS:
+            if name in obj:
+                struct._set(name, obj[name])
+        return struct
+
+    def to_dict(self) -> dict:
+        result = {}
+        for name in self.FIELDS:
+            try:
+                value = getattr(self, name)
+            except AttributeError:
+                continue
+            result[name] = value.to_dict() if isinstance(value, Struct) else value
+        return result
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class DiscordProfile(Struct):
+    FIELDS = {
+        "user_id": str,
+        "username": str,
+        "display_name": str,
+        "avatar_url": str,
+        "avatar_hash": str,
+        "discriminator": str,
+        "public_flags": int,
+        "is_bot": bool,
+        "created_at": str,
+        "banner_url": str,
+        "accent_color": str,
+        "status": str,
+        "activity": str,
+        "custom_status": str,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class RobloxProfile(Struct):
+    FIELDS = {
+        "user_id": int,
+        "username": str,
+        "display_name": str,
+        "avatar_url": str,
+        "friends_count": int,
+        "followers_count": int,
+        "following_count": int,
+        "description": str,
+        "is_banned": bool,
+        "created_at": str,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class ProfileData(Struct):
+    """One account's profile as served by /api/profile and saved to disk."""
+    FIELDS = {
+        "last_update": str,
+        "last_event": str,  # Newest gateway event patched in after last_update
+        "discord": DiscordProfile,
+        "roblox": RobloxProfile,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+def default_profile(account: TrackedAccount) -> ProfileData:
+    """Return the fallback profile served when no data has been saved yet.
+
+    ``last_update`` is None, as nothing has been fetched; clients (and
+    data_age) can tell it apart from real data. Fetchers also fall back to
+    its sections for fields an upstream couldn't provide.
+    """
+    profile = ProfileData(
+        last_update=None,
+        discord=DiscordProfile(user_id=str(account.discord_user_id)) if account.discord_user_id else DiscordProfile(),
+        roblox=RobloxProfile(user_id=account.roblox_user_id) if account.roblox_user_id else RobloxProfile(),
+    )
+    if account.account_id == DEFAULT_ACCOUNT_ID:
+        profile.discord = DiscordProfile(
+            user_id=str(DISCORD_USER_ID),
+            username="Realice",
+            display_name="David",
+            avatar_url=None,
+            status="online",
+            custom_status="Life to no Limits",
+        )
+        profile.roblox = RobloxProfile(
+            user_id=ROBLOX_USER_ID,
+            username="temix100000",
+            display_name="Realice",
+            avatar_url=None,
+            friends_count=0,
+            followers_count=0,
+            following_count=0,
+        )
+    return profile
+
+
+# ==================== SERIALIZERS ====================
+
+class Serializer(NamedTuple):
+    dumps: Callable[[object], bytes]
+    loads: Callable[[bytes], object]
+
+
+def _json_serializer() -> Serializer:
+    return Serializer(lambda obj: json.dumps(obj, separators=(",", ":"), default=str).encode(), json.loads)
+
+
+def _orjson_serializer() -> Serializer:
+    import orjson
+    return Serializer(lambda obj: orjson.dumps(obj, default=str), orjson.loads)
+
+
+def _msgpack_serializer() -> Serializer:
+    import msgpack
+    return Serializer(lambda obj: msgpack.packb(obj, default=str), msgpack.unpackb)
+
+
+SERIALIZERS = {"json": _json_serializer, "orjson": _orjson_serializer, "msgpack": _msgpack_serializer}
+_serializers: dict = {}
+
+
+def serializer(name: str) -> Serializer:
+    """Return the named backend from SERIALIZERS, importing it on first use.
+
+    "auto" is orjson when it's installed and the stdlib json otherwise.
+    """
+    backend = _serializers.get(name)
+    if backend is None:
+        if name == "auto":
+            try:
+                backend = _orjson_serializer()
+            except ImportError:
+                backend = _json_serializer()
+        else:
+            backend = SERIALIZERS[name]()
+        _serializers[name] = backend
+    return backend
+
+
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """A named family of samples, one per combination of label values.
+
+    Updates take a lock because Flask handlers record from many threads;
+    each is a dict lookup and an add, so the hot path stays cheap.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down; ``collect`` computes it at scrape time instead."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), collect=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> list:
+        if self.collect is not None:
+            values = self.collect()
+            with self._lock:
+                self._values = values
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> bytes:
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+
+def _snapshot_ages() -> dict:
+    ages = {}
+    now = datetime.now()
+    for account_id, snapshot in profile_registry.snapshots.items():
+        try:
+            last_update = datetime.fromisoformat(snapshot.get()["last_update"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        ages[(account_id,)] = (now - last_update).total_seconds()
+    return ages
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+metrics = MetricsRegistry()
+API_REQUESTS = metrics.register(Counter(
+    "profile_api_requests_total", "API requests by route and status.", ("route", "status")))
+API_LATENCY = metrics.register(Histogram(
+    "profile_api_request_seconds", "Time to produce an API response.", ("route",)))
+PREPARED_CACHE = metrics.register(Counter(
+    "profile_prepared_cache_total", "Prepared response lookups by result (hit or miss).", ("result",)))
+UPSTREAM_RESPONSES = metrics.register(Counter(
+    "profile_upstream_responses_total", "Upstream responses by host and status (error for network failures).",
+    ("host", "status")))
+UPSTREAM_LATENCY = metrics.register(Histogram(
+    "profile_upstream_request_seconds", "Upstream request latency per attempt.", ("host",)))
+API_REJECTIONS = metrics.register(Counter(
+    "profile_api_rejected_total", "API requests turned away by admission control, by reason.", ("reason",)))
+UPSTREAM_RETRIES = metrics.register(Counter(
+    "profile_upstream_retries_total", "Upstream requests retried after a failure or 429.", ("host",)))
+SNAPSHOT_AGE = metrics.register(Gauge(
+    "profile_snapshot_age_seconds", "Seconds since each account was last refreshed.", ("account",),
+    collect=_snapshot_ages))
+SAVE_SECONDS = metrics.register(Histogram(
+    "profile_save_seconds", "Time to write a profile file to disk."))
+LOOP_LAG = metrics.register(Histogram(
+    "profile_event_loop_lag_seconds", "How late the bot's event loop wakes a sleeping task."))
+
+
+def observe_request(route: str, status: int, started: float):
+    API_REQUESTS.inc(route, status)
+    API_LATENCY.observe(time.perf_counter() - started, route)
+
+
+# ==================== PERSISTENCE ====================
+
+def encode_profile(data: dict) -> bytes:
+    """Encode profile data for disk in PERSIST_FORMAT."""
+    return serializer("msgpack" if PERSIST_FORMAT == "msgpack" else JSON_BACKEND).dumps(data)
+
+
+def decode_profile(raw: bytes) -> dict:
+    """Decode a profile file written in either format.
+
+    JSON objects always start with "{", which no msgpack map does, so files
+    written before PERSIST_FORMAT changed stay readable. The result is
+    validated through ProfileData; a mistyped field raises ValueError.
+    """
+    backend = serializer(JSON_BACKEND if raw.lstrip()[:1] == b"{" else "msgpack")
+    return ProfileData.validate(backend.loads(raw))
+
+
+def read_profile_file(path: str) -> Optional[dict]:
+    """Read and decode a profile file, or return None if it's missing or invalid."""
+    try:
+        with open(path, 'rb') as f:
+            return decode_profile(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.error("Error loading profile data from %s: %s", path, e)
+        return None
+
+
+def write_profile_file(path: str, data: dict) -> float:
+    """Atomically replace ``path`` with ``data`` and return the new mtime.
+
+    The data goes to a temp file in the same directory, is fsynced, then
+    renamed over ``path``, so readers see either the old file or the new
+    one and never a partial write.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    payload = encode_profile(data)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".profile-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+    return os.stat(path).st_mtime
+
+
+class ProfileWriter:
+    """Writes profile files off the event loop, coalescing bursts.
+
+    ``submit()`` only records the latest data for a file. One drain task per
+    file waits PERSIST_DEBOUNCE seconds, then writes whatever is latest in
+    an executor thread; anything submitted during that write is written
+    once more afterwards.
+    """
+
+    def __init__(self):
+        self._latest: dict = {}  # path -> (snapshot, data) still to be written
+        self._tasks: dict = {}  # path -> drain task
+        self._flush_now: Optional[asyncio.Event] = None
+
+    def submit(self, snapshot: "ProfileSnapshot", data: dict):
+        path = snapshot.account.data_file
+        self._latest[path] = (snapshot, data)
+        task = self._tasks.get(path)
+        if task is None or task.done():
+            self._tasks[path] = asyncio.get_running_loop().create_task(self._drain(path))
+
+    async def _drain(self, path: str):
+        if self._flush_now is None:
+            self._flush_now = asyncio.Event()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._flush_now.wait(), PERSIST_DEBOUNCE)
+        loop = asyncio.get_running_loop()
+        while path in self._latest:
+            snapshot, data = self._latest.pop(path)
+            mtime = None
+            snapshot.begin_write()
+            try:
+                started = time.perf_counter()
+                mtime = await loop.run_in_executor(None, write_profile_file, path, data)
+                elapsed = time.perf_counter() - started
+                SAVE_SECONDS.observe(elapsed)
+                log.debug("Data saved to %s in %.1fms", path, elapsed * 1000)
+            except Exception as e:
+                log.error("Error saving data to %s: %s", path, e)
+            finally:
+                snapshot.end_write(mtime)
+
+    async def flush(self):
+        """Write everything still pending right away."""
+        if self._flush_now is None:
+            self._flush_now = asyncio.Event()
+        self._flush_now.set()
+        try:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            self._flush_now.clear()
+
+
+class PreparedResponse(NamedTuple):
+    """A snapshot section serialized once, ready to be written to clients."""
+    body: bytes
+    etag: str
+    last_modified: Optional[str]
+    last_modified_ts: Optional[float]
+    content_encoding: Optional[str] = None
+
+
+def _last_modified(data: dict) -> tuple:
+    """Return (HTTP date, timestamp) for the snapshot's newest change.
+
+    That's last_update, or last_event when a gateway event patched the
+    data after the last full refresh.
+    """
+    timestamps = []
+    for key in ("last_update", "last_event"):
+        try:
+            timestamps.append(datetime.fromisoformat(data[key]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            pass
+    if not timestamps:
+        return None, None
+    ts = max(timestamps)
+    return formatdate(ts, usegmt=True), ts
+
+
+def prepare_response(payload, data: dict) -> PreparedResponse:
+    """Serialize ``payload`` and derive its validators from ``data``."""
+    body = serializer(JSON_BACKEND).dumps(payload)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    return PreparedResponse(body, etag, *_last_modified(data))
+
+
+def encode_prepared(identity: PreparedResponse, encoding: str) -> PreparedResponse:
+    """Compress an identity response, or return it as-is if it's too small to bother."""
+    if len(identity.body) < COMPRESS_MIN_BYTES:
+        return identity
+    return identity._replace(
+        body=_compress(identity.body, encoding),
+        etag=f'{identity.etag[:-1]}-{encoding}"',
+        content_encoding=encoding,
+    )
+
+
+def _select_section(data: dict, section: str):
+    return data if section == "profile" else data.get(section, {})
+
+
+def parse_fields(raw: Optional[str]) -> Optional[tuple]:
+    """Parse ``?fields=discord.avatar_url,roblox.followers_count`` into a canonical tuple."""
+    if not raw:
+        return None
+    fields = {field.strip() for field in raw.split(",") if field.strip()}
+    return tuple(sorted(fields)[:MAX_PROJECTION_FIELDS]) or None
+
+
+def project(data: dict, fields: tuple) -> dict:
+    """Return only the dotted ``fields`` of ``data``, keeping their nesting.
+
+    Missing paths are left out; a path inside one that's already selected
+    in full adds nothing.
+    """
+    result = {}
+    for field in sorted(fields, key=len):
+        parts = field.split(".")
+        # Resolve the whole path first, so a missing leaf leaves no empty parents behind
+        values = []
+        source = data
+        for part in parts:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            values.append(source)
+        else:
+            target = result
+            for part, value in zip(parts[:-1], values):
+                if target.get(part) is value:
+                    break
+                target = target.setdefault(part, {})
+            else:
+                target[parts[-1]] = values[-1]
+    return result
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+        return brotli.compress(body, quality=9)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _brotli_available() -> bool:
+    global _HAS_BROTLI
+    if _HAS_BROTLI is None:
+        try:
+            import brotli  # noqa: F401
+            _HAS_BROTLI = True
+        except ImportError:
+            _HAS_BROTLI = False
+    return _HAS_BROTLI
+
+
+_HAS_BROTLI: Optional[bool] = None
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, if the client takes either."""
+    if not accept_encoding:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    if "br" in accepted and _brotli_available():
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class ProfileSnapshot:
+    """In-process copy of one account's profile, shared by the cog and the API.
+
+    The cog publishes a new dict after every refresh; readers get that same
+    dict back without touching the disk. Published dicts are never mutated,
+    so handing out the reference is safe across threads. The data file is
+    only re-read on a cold start or when its mtime shows it was edited
+    externally.
+    """
+
+    def __init__(self, account: TrackedAccount):
+        self.account = account
+        self._lock = threading.Lock()
+        self._data: Optional[dict] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._writes_in_flight = 0
+        # (snapshot dict, {section: PreparedResponse}), built lazily
+        self._prepared: tuple = (None, {})
+        self._broadcaster: Optional[ProfileBroadcaster] = None
+        self.generation = 0
+
+    def publish(self, data: dict, mtime: Optional[float] = None):
+        """Atomically replace the current snapshot.
+
+        ``mtime`` is the data file mtime matching ``data``; leave it as None
+        when the file wasn't written so the last known mtime is kept.
+        """
+        with self._lock:
+            self._data = data
+            if mtime is not None:
+                self._mtime = mtime
+            self._checked_at = time.monotonic()
+            self.generation += 1
+            # Under the lock so stream clients see changes in publish order
+            if self._broadcaster is not None:
+                self._broadcaster.publish(data, self.generation)
+
+    def broadcaster(self) -> "ProfileBroadcaster":
+        """Return the broadcaster for live updates, creating it on first use."""
+        if self._broadcaster is None:
+            data = self.get()
+            with self._lock:
+                if self._broadcaster is None:
+                    self._broadcaster = ProfileBroadcaster(self._data or data, self.generation)
+        return self._broadcaster
+
+    def begin_write(self):
+        """Mark our own write of the data file as started.
+
+        While it runs, mtime changes are ours, not external edits, and must
+        not cause a reload (the file may hold older data than we serve).
+        """
+        with self._lock:
+            self._writes_in_flight += 1
+
+    def end_write(self, mtime: Optional[float]):
+        with self._lock:
+            self._writes_in_flight -= 1
+            if mtime is not None:
+                self._mtime = mtime
+
+    def _reload_from_disk(self) -> Optional[dict]:
+        path = self.account.data_file
+        mtime = _file_mtime(path)
+        if mtime is None:
+            return None
+        data = read_profile_file(path)
+        if data is None:
+            return None
+        self.publish(data, mtime)
+        return data
+
+    def get(self) -> dict:
+        """Return the current snapshot, reloading only if the file changed."""
+        data = self._data
+        now = time.monotonic()
+        if data is not None and now - self._checked_at < SNAPSHOT_STAT_INTERVAL:
+            return data
+
+        with self._lock:
+            data = self._data
+            stale = data is None
+            if not stale and not self._writes_in_flight and now - self._checked_at >= SNAPSHOT_STAT_INTERVAL:
+                self._checked_at = now
+                mtime = _file_mtime(self.account.data_file)
+                stale = mtime is not None and mtime != self._mtime
+
+        if stale:
+            data = self._reload_from_disk() or data
+        if data is None:
+            # Nothing on disk yet; pin one default so its ETag stays stable
+            data = default_profile(self.account).to_dict()
+            self.publish(data)
+        return data
+
+    def prepared(self, section: str, fields: Optional[tuple] = None,
+                 encoding: Optional[str] = None) -> PreparedResponse:
+        """Return the serialized ``section`` ("profile", "discord" or "roblox").
+
+        ``fields`` projects the section down to those dotted paths and
+        ``encoding`` ("gzip" or "br") compresses it. Every variant is
+        cached per published snapshot, so it's built once per refresh no
+        matter how many requests read it; variants nobody asks for are
+        never built.
+        """
+        data = self.get()
+        cached_data, variants = self._prepared
+        if cached_data is not data:
+            variants = {}
+            self._prepared = (data, variants)
+
+        key = (section, fields, encoding)
+        prepared = variants.get(key)
+        if prepared is not None:
+            PREPARED_CACHE.inc("hit")
+            return prepared
+        PREPARED_CACHE.inc("miss")
+
+        if encoding:
+            prepared = encode_prepared(self.prepared(section, fields), encoding)
+            if prepared.content_encoding is None:
+                return prepared
+        else:
+            payload = _select_section(data, section)
+            if fields:
+                payload = project(payload, fields)
+            prepared = prepare_response(payload, data)
+
+        # Arbitrary ?fields= values must not grow the cache without bound
+        if len(variants) < PREPARED_CACHE_LIMIT or not fields:
+            variants[key] = prepared
+        return prepared
+
+
+class ProfileRegistry:
+    """The tracked accounts and their snapshots."""
+
+    def __init__(self, accounts: dict):
+        self.accounts = accounts
+        self.snapshots = {account_id: ProfileSnapshot(account) for account_id, account in accounts.items()}
+
+    @property
+    def primary(self) -> ProfileSnapshot:
+        return self.snapshots[DEFAULT_ACCOUNT_ID]
+
+    def get(self, account_id: str) -> Optional[ProfileSnapshot]:
+        return self.snapshots.get(account_id)
+
+    def close_streams(self):
+        """Disconnect every live-update stream client."""
+        for snapshot in self.snapshots.values():
+            if snapshot._broadcaster is not None:
+                snapshot._broadcaster.close_all()
+
+
+profile_registry = ProfileRegistry(load_accounts())
+profile_snapshot = profile_registry.primary
+
+
+# ==================== SHARED SNAPSHOT ====================
+
+_SHARED_MAGIC = b"PROFSHM1"
+_SHARED_U64 = struct.Struct("<Q")
+_SHARED_U32 = struct.Struct("<I")
+_SHARED_SEQ_OFFSET = 8
+_SHARED_LENGTH_OFFSET = 16
+_SHARED_PAYLOAD_OFFSET = 24
+SHARED_SECTIONS = ("profile", "discord", "roblox")
+
+
+class SharedSnapshotWriter:
+    """Publishes every account's prepared responses into a memory-mapped file.
+
+    API worker processes map the same file and serve straight from it. The
+    header is guarded by a sequence lock: the sequence number is odd while
+    the payload is rewritten, and the length is stored before it turns even
+    again, so a reader that sees the same even number before and after
+    copying has a consistent payload. The payload is a 4-byte index length,
+    the JSON index, then the response bodies back to back.
+    """
+
+    def __init__(self, path: str = SHARED_SNAPSHOT_FILE, size: int = SHARED_SNAPSHOT_SIZE):
+        self.path = path
+        self.size = size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        # Carry on from a previous run's sequence so running workers notice the new data
+        seq = _SHARED_U64.unpack_from(self._mm, _SHARED_SEQ_OFFSET)[0] if self._mm[:8] == _SHARED_MAGIC else 0
+        self._seq = seq + (seq & 1)
+        self._mm[:8] = _SHARED_MAGIC
+        self._pending: Optional[asyncio.Handle] = None
+
+    def schedule(self):
+        """Publish once the current burst of snapshot changes has been made."""
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().call_soon(self.publish)
+
+    def publish(self):
+        self._pending = None
+        encodings = [None, "gzip"] + (["br"] if _brotli_available() else [])
+        index = {}
+        bodies = []
+        offset = 0
+        for account_id, snapshot in profile_registry.snapshots.items():
+            entries = index[account_id] = {}
+            for section in SHARED_SECTIONS:
+                for encoding in encodings:
+                    # Cached on the snapshot, so only accounts that changed are re-encoded
+                    prepared = snapshot.prepared(section, None, encoding)
+                    entries[f"{section}:{encoding or ''}"] = [
+                        offset, len(prepared.body), prepared.etag, prepared.last_modified,
+                        prepared.last_modified_ts, prepared.content_encoding,
+                    ]
+                    bodies.append(prepared.body)
+                    offset += len(prepared.body)
+        index_bytes = json.dumps(index, separators=(",", ":")).encode()
+        payload = b"".join([_SHARED_U32.pack(len(index_bytes)), index_bytes, *bodies])
+        if _SHARED_PAYLOAD_OFFSET + len(payload) > self.size:
+            log.error("Shared snapshot needs %d bytes, more than SHARED_SNAPSHOT_SIZE; not published", len(payload))
+            return
+
+        mm = self._mm
+        self._seq += 1
+        _SHARED_U64.pack_into(mm, _SHARED_SEQ_OFFSET, self._seq)
+        mm[_SHARED_PAYLOAD_OFFSET:_SHARED_PAYLOAD_OFFSET + len(payload)] = payload
+        _SHARED_U64.pack_into(mm, _SHARED_LENGTH_OFFSET, len(payload))
+        self._seq += 1
+        _SHARED_U64.pack_into(mm, _SHARED_SEQ_OFFSET, self._seq)
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        self._mm.close()
+
+
+class SharedSnapshotReader:
+    """A worker's view of the file SharedSnapshotWriter maintains.
+
+    A request only reads the 8-byte sequence number. The payload is copied
+    out and its index decoded once per publish, and bodies are sliced out
+    the first time they're asked for. ``?fields=`` projections decode the
+    profile itself, once per publish, and are cached like
+    ProfileSnapshot.prepared caches them.
+    """
+
+    def __init__(self, path: str = SHARED_SNAPSHOT_FILE):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._seq: Optional[int] = None
+        self._index: dict = {}
+        self._bodies = b""
+        self._variants: dict = {}
+        self._decoded: dict = {}
+        # Wait for a first consistent copy here, before any request depends
+        # on it; after that a request never waits for the writer
+        delay = 0.001
+        deadline = time.monotonic() + 5
+        while not self._refresh() and time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def _refresh(self) -> bool:
+        """Pick up a newer publish; False if the writer was mid-write every attempt."""
+        mm = self._mm
+        if _SHARED_U64.unpack_from(mm, _SHARED_SEQ_OFFSET)[0] == self._seq:
+            return True
+        for _ in range(SHARED_READ_ATTEMPTS):
+            seq = _SHARED_U64.unpack_from(mm, _SHARED_SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            length = _SHARED_U64.unpack_from(mm, _SHARED_LENGTH_OFFSET)[0]
+            payload = mm[_SHARED_PAYLOAD_OFFSET:_SHARED_PAYLOAD_OFFSET + length]
+            if _SHARED_U64.unpack_from(mm, _SHARED_SEQ_OFFSET)[0] == seq:
+                break
+        else:
+            # The writer is busy; keep serving the previous publish rather than spin
+            return False
+
+        if payload:
+            (index_length,) = _SHARED_U32.unpack_from(payload, 0)
+            self._index = json.loads(payload[4:4 + index_length])
+            self._bodies = payload[4 + index_length:]
+        self._variants = {}
+        self._decoded = {}
+        self._seq = seq
+        return True
+
+    def _body(self, entry: list) -> bytes:
+        offset, length = entry[0], entry[1]
+        return self._bodies[offset:offset + length]
+
+    def prepared(self, section: str, account_id: str, fields: Optional[tuple] = None,
+                 encoding: Optional[str] = None) -> Optional[PreparedResponse]:
+        self._refresh()
+        key = (account_id, section, fields, encoding)
+        prepared = self._variants.get(key)
+        if prepared is not None:
+            return prepared
+        entries = self._index.get(account_id)
+        if entries is None:
+            return None
+
+        if fields:
+            data = self._decoded.get(account_id)
+            if data is None:
+                data = self._decoded[account_id] = json.loads(self._body(entries["profile:"]))
+            prepared = prepare_response(project(_select_section(data, section), fields), data)
+            if encoding:
+                prepared = encode_prepared(prepared, encoding)
+        else:
+            entry = entries.get(f"{section}:{encoding or ''}") or entries[f"{section}:"]
+            prepared = PreparedResponse(self._body(entry), *entry[2:])
+
+        if len(self._variants) < PREPARED_CACHE_LIMIT or not fields:
+            self._variants[key] = prepared
+        return prepared
+
+
+shared_reader: Optional[SharedSnapshotReader] = None  # Set in API worker processes
+
+
+def get_profile_data(account_id: str = DEFAULT_ACCOUNT_ID) -> Optional[dict]:
+    """Return profile data for the API from the in-memory snapshot."""
+    snapshot = profile_registry.get(account_id)
+    return snapshot.get() if snapshot else None
+
+
+def get_prepared(section: str, account_id: str = DEFAULT_ACCOUNT_ID, fields: Optional[tuple] = None,
+                 encoding: Optional[str] = None) -> Optional[PreparedResponse]:
+    """Return the serialized ``section`` of an account, or None if it isn't tracked."""
+    if shared_reader is not None:
+        return shared_reader.prepared(section, account_id, fields, encoding)
+    snapshot = profile_registry.get(account_id)
+    return snapshot.prepared(section, fields, encoding) if snapshot else None
+
+
+# ==================== LIVE UPDATES ====================
+
+def _pointer(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def json_patch(old, new, path: str = "") -> list:
+    """Return the RFC 6902 operations that turn ``old`` into ``new``."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": f"{path}/{_pointer(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            key_path = f"{path}/{_pointer(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": key_path, "value": value})
+            elif old[key] != value:
+                ops.extend(json_patch(old[key], value, key_path))
+        return ops
+    return [] if old == new else [{"op": "replace", "path": path, "value": new}]
+
+
+def _sse_frame(event: str, generation: int, payload: bytes) -> bytes:
+    return b"event: %s\nid: %d\ndata: %s\n\n" % (event.encode(), generation, payload)
+
+
+SSE_HEARTBEAT = b": ping\n\n"
+
+
+class StreamSubscriber:
+    """One connected stream client: a bounded frame buffer and a wake-up callback."""
+
+    __slots__ = ("frames", "notify", "needs_resync", "closed")
+
+    def __init__(self, notify):
+        self.frames: deque = deque()
+        self.notify = notify  # Called from any thread when frames are waiting
+        self.needs_resync = True  # The first drain sends the full snapshot
+        self.closed = False
+
+
+class ProfileBroadcaster:
+    """Fans snapshot changes out to stream clients as JSON-patch events.
+
+    Each change is diffed and encoded once, and the same bytes are queued
+    for every client. A client that falls STREAM_BUFFER_SIZE events behind
+    has its buffer dropped and gets one full snapshot on its next read
+    instead, so slow clients cost bounded memory and never block the rest.
+    """
+
+    def __init__(self, data: dict, generation: int):
+        self._lock = threading.Lock()
+        self._data = data
+        self._generation = generation
+        self._snapshot_frame: Optional[bytes] = None
+        self._subscribers: set = set()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, data: dict, generation: int):
+        with self._lock:
+            previous, self._data = self._data, data
+            self._generation = generation
+            self._snapshot_frame = None
+            if not self._subscribers or previous is data:
+                return
+            ops = json_patch(previous, data)
+            if not ops:
+                return
+            frame = _sse_frame("patch", generation, serializer(JSON_BACKEND).dumps(ops))
+            for subscriber in self._subscribers:
+                if subscriber.needs_resync:
+                    continue
+                if len(subscriber.frames) >= STREAM_BUFFER_SIZE:
+                    subscriber.frames.clear()
+                    subscriber.needs_resync = True
+                else:
+                    subscriber.frames.append(frame)
+        for subscriber in list(self._subscribers):
+            subscriber.notify()
+
+    def subscribe(self, notify) -> Optional[StreamSubscriber]:
+        """Register a client, or return None when STREAM_MAX_SUBSCRIBERS is reached."""
+        with self._lock:
+            if len(self._subscribers) >= STREAM_MAX_SUBSCRIBERS:
+                return None
+            subscriber = StreamSubscriber(notify)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: StreamSubscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def drain(self, subscriber: StreamSubscriber) -> list:
+        """Take the frames waiting for ``subscriber``."""
+        with self._lock:
+            if subscriber.needs_resync:
+                subscriber.needs_resync = False
+                subscriber.frames.clear()
+                if self._snapshot_frame is None:
+                    payload = serializer(JSON_BACKEND).dumps(self._data)
+                    self._snapshot_frame = _sse_frame("snapshot", self._generation, payload)
+                return [self._snapshot_frame]
+            frames = list(subscriber.frames)
+            subscriber.frames.clear()
+            return frames
+
+    def close_all(self):
+        """Ask every connected client to disconnect."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber.closed = True
+        for subscriber in subscribers:
+            subscriber.notify()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # A cached gzip copy and its identity body are the same document
+    base = etag.split("-")[0] + '"' if "-" in etag else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag or candidate == base:
+            return True
+    return False
+
+
+def is_not_modified(prepared: PreparedResponse, if_none_match: Optional[str],
+                    if_modified_since: Optional[str]) -> bool:
+    """Evaluate conditional GET headers against a prepared response."""
+    if if_none_match:
+        return _etag_matches(if_none_match, prepared.etag)
+    if if_modified_since and prepared.last_modified_ts is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(prepared.last_modified_ts) <= since
+    return False
+
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,X-Requested-With',
+    'Access-Control-Allow-Methods': 'GET,OPTIONS',
+}
+CACHE_CONTROL = 'public, max-age=300'  # Cache for 5 minutes
+
+
+def default_cache_control(status: int) -> str:
+    """Cache-Control for a response that set none: only successes may be cached.
+
+    A shared cache (or the Supabase proxy) must not keep serving a 429,
+    503 or error after it has cleared up.
+    """
+    return CACHE_CONTROL if 200 <= status < 300 or status == 304 else "no-store"
+
+
+NOT_FOUND_BODY = b'{"error":"Unknown account"}'
+
+
+def conditional_response(section: str, request_headers, account_id: str = DEFAULT_ACCOUNT_ID,
+                         fields: Optional[str] = None) -> tuple:
+    """Return (status, headers, body) for ``section``.
+
+    Honours conditional GETs, Accept-Encoding and ``?fields=`` projection.
+    ``request_headers`` is any case-insensitive mapping, so the Flask and
+    aiohttp servers share this and answer identically.
+    """
+    prepared = get_prepared(
+        section,
+        account_id,
+        parse_fields(fields),
+        choose_encoding(request_headers.get("Accept-Encoding")),
+    )
+    if prepared is None:
+        return 404, {"Content-Type": "application/json"}, NOT_FOUND_BODY
+    headers = {"ETag": prepared.etag, "Vary": "Accept-Encoding"}
+    if prepared.last_modified:
+        headers["Last-Modified"] = prepared.last_modified
+
+    if is_not_modified(prepared, request_headers.get("If-None-Match"), request_headers.get("If-Modified-Since")):
+        return 304, headers, b""
+    headers["Content-Type"] = "application/json"
+    if prepared.content_encoding:
+        headers["Content-Encoding"] = prepared.content_encoding
+    return 200, headers, prepared.body
+
+
+def health_payload() -> dict:
+    return {
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "discord_user_id": DISCORD_USER_ID,
+        "roblox_user_id": ROBLOX_USER_ID,
+        "accounts": len(profile_registry.accounts)
+    }
+
+
+def root_payload() -> dict:
+    return {
+        "name": "Profile API",
+        "version": "1.0.0",
+        "endpoints": {
+            "profile": "/api/profile[?fields=discord.avatar_url,roblox.followers_count]",
+            "discord": "/api/profile/discord",
+            "roblox": "/api/profile/roblox",
+            "account": "/api/profile/<account_id>[/discord|/roblox]",
+            "stream": "/api/profile[/<account_id>]/stream",
+            "history": "/api/profile[/<account_id>]/history?metric=followers_count[&from=&to=&step=]",
+            "avatar": "/api/avatar/<discord|roblox>[?size=&format=webp&account=]",
+            "banner": "/api/banner[?account=]",
+            "health": "/api/health",
+            "metrics": "/metrics"
+        }
+    }
+
+
+# ==================== ADMISSION CONTROL ====================
+
+RATE_LIMITED_BODY = b'{"error":"Too many requests"}'
+OVERLOADED_BODY = b'{"error":"Server busy"}'
+
+
+class ClientRateLimiter:
+    """Token bucket per client IP, in a table of at most ``max_clients`` entries.
+
+    A check is O(1): one dict lookup, a move to the LRU end and a refill
+    computed from the time since the client's previous request. Past
+    ``max_clients`` the least recently seen client is forgotten and comes
+    back with a full bucket, so eviction only ever errs towards admitting.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = API_RATE_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clients: OrderedDict = OrderedDict()  # IP -> [tokens, monotonic time of last refill]
+        self._lock = threading.Lock()
+
+    def admit(self, client: str) -> Optional[float]:
+        """Take a token for ``client``; return None if admitted, else seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._clients.get(client)
+            if state is None:
+                state = self._clients[client] = [self.burst, now]
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(client)
+                state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+                state[1] = now
+            if state[0] >= 1:
+                state[0] -= 1
+                return None
+            return (1 - state[0]) / self.rate
+
+
+class Admission:
+    """Decides whether the API takes on a request, before any work is done for it.
+
+    Clients over their API_RATE_LIMIT get 429 with Retry-After; beyond
+    API_MAX_IN_FLIGHT requests at once everyone gets 503, so a burst
+    queues at the socket instead of piling up threads or memory. Each API
+    worker process keeps its own tables.
+    
+    Traffic relayed by a proxy would otherwise share the proxy's bucket:
+    behind API_TRUSTED_PROXIES each forwarded client gets its own, and a
+    proxy sending API_PROXY_SECRET (the Supabase profile-proxy) isn't
+    rate limited at all.
+    """
+
+    def __init__(self, rate_limit: tuple = API_RATE_LIMIT, max_in_flight: int = API_MAX_IN_FLIGHT,
+                 exempt=API_RATE_EXEMPT, trusted_proxies=API_TRUSTED_PROXIES,
+                 proxy_secret: Optional[str] = API_PROXY_SECRET):
+        self.rates = ClientRateLimiter(*rate_limit)
+        self.max_in_flight = max_in_flight
+        self.exempt = exempt
+        self.trusted_proxies = trusted_proxies
+        self.proxy_secret = proxy_secret.encode() if proxy_secret else None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def client(self, remote: Optional[str], headers) -> Optional[str]:
+        """The client to rate limit a request from ``remote`` as, or None if it's exempt.
+
+        Behind a trusted proxy this is the last X-Forwarded-For address,
+        the one the proxy itself added; earlier ones can be forged.
+        """
+        if self.proxy_secret is not None:
+            sent = headers.get("X-Proxy-Secret", "").encode("utf-8", "replace")
+            if hmac.compare_digest(sent, self.proxy_secret):
+                return None
+        remote = remote or ""
+        if remote in self.trusted_proxies:
+            remote = headers.get("X-Forwarded-For", "").rsplit(",", 1)[-1].strip() or remote
+        return None if remote in self.exempt else remote
+
+    def admit(self, client: Optional[str], in_flight: bool = True) -> Optional[tuple]:
+        """Return None and count the request in flight, or the (status, headers, body) to reject it with.
+
+        ``client`` comes from ``client()``; None skips the rate limit.
+        Every admitted request must be matched by a ``release()``, except
+        with ``in_flight=False`` (streams, which STREAM_MAX_SUBSCRIBERS
+        caps instead), where only the rate limit applies.
+        """
+        if client is not None:
+            wait = self.rates.admit(client)
+            if wait is not None:
+                API_REJECTIONS.inc("rate_limit")
+                return 429, {"Content-Type": "application/json", "Retry-After": str(int(wait) + 1)}, RATE_LIMITED_BODY
+        if not in_flight:
+            return None
+        with self._lock:
+            admitted = self.in_flight < self.max_in_flight
+            if admitted:
+                self.in_flight += 1
+        if not admitted:
+            API_REJECTIONS.inc("in_flight")
+            return 503, {"Content-Type": "application/json", "Retry-After": "1"}, OVERLOADED_BODY
+        return None
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+admission = Admission()
+
+
+# ==================== IMAGE CACHE ====================
+
+class CachedImage(NamedTuple):
+    path: str
+    etag: str
+    content_type: str
+    size: int
+
+
+_IMAGE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp"}
+_EXTENSION_TYPES = {ext: content_type for content_type, ext in _IMAGE_EXTENSIONS.items()}
+
+
+def _resize_image(path: str, size: Optional[int], fmt: Optional[str]) -> Optional[tuple]:
+    """Return ``(body, content_type)`` for a resized/re-encoded copy, or None without Pillow."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    fmt = fmt or "png"
+    with Image.open(path) as image:
+        # Animated avatars keep only their first frame
+        image = image.convert("RGBA")
+        if size:
+            image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.save(out, format=fmt.upper(), **({"quality": 85, "method": 4} if fmt == "webp" else {}))
+    return out.getvalue(), f"image/{fmt}"
+
+
+class ImageCache:
+    """Size-bounded LRU disk cache of avatar and banner images.
+
+    Entries are keyed by source URL plus variant. Discord CDN URLs contain
+    the avatar hash and Roblox thumbnail URLs the content hash, so a new
+    avatar is a new key and each image is downloaded once. Files are named
+    ``<key>.<etag>.<ext>``, which lets the index be rebuilt from a directory
+    listing. Downloads run on the bot's loop through the shared
+    OutboundClient; until the cog attaches one, misses return None and the
+    API redirects to the origin instead.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> CachedImage, least recently used first
+        self._bytes = 0
+        self._scanned = False
+        self._inflight: dict = {}  # key -> download task, only touched on self.loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http = None  # The cog's OutboundClient, once attached
+
+    def attach(self, loop: asyncio.AbstractEventLoop, http):
+        self.loop = loop
+        self.http = http
+
+    def detach(self):
+        self.loop = None
+        self.http = None
+
+    @staticmethod
+    def key(url: str, size: Optional[int] = None, fmt: Optional[str] = None) -> str:
+        return hashlib.blake2b(f"{url}|{size}|{fmt}".encode(), digest_size=12).hexdigest()
+
+    def _scan(self):
+        """Index images left on disk by a previous run, oldest first."""
+        self._scanned = True
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        found = []
+        for name in names:
+            parts = name.split(".")
+            if len(parts) != 3 or parts[2] not in _EXTENSION_TYPES:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, parts[0], CachedImage(path, f'"{parts[1]}"', _EXTENSION_TYPES[parts[2]], stat.st_size)))
+        for _, key, entry in sorted(found):
+            self._entries[key] = entry
+            self._bytes += entry.size
+        self._evict()
+
+    def lookup(self, key: str) -> Optional[CachedImage]:
+        with self._lock:
+            if not self._scanned:
+                self._scan()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            with contextlib.suppress(OSError):
+                os.unlink(entry.path)
+
+    def _store(self, key: str, body: bytes, content_type: str) -> CachedImage:
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        ext = _IMAGE_EXTENSIONS.get(content_type, "png")
+        path = os.path.join(self.directory, f"{key}.{etag}.{ext}")
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        entry = CachedImage(path, f'"{etag}"', _EXTENSION_TYPES[ext], len(body))
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+                if previous.path != path:
+                    with contextlib.suppress(OSError):
+                        os.unlink(previous.path)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    async def fetch(self, url: str, size: Optional[int] = None, fmt: Optional[str] = None) -> Optional[CachedImage]:
+        """Return the cached image, downloading it first if needed. Runs on self.loop."""
+        key = self.key(url, size, fmt)
+        entry = self.lookup(key)
+        if entry is not None or self.http is None:
+            return entry
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(key, url, size, fmt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, key: str, url: str, size: Optional[int], fmt: Optional[str]) -> Optional[CachedImage]:
+        loop = asyncio.get_running_loop()
+        if size or fmt:
+            original = await self.fetch(url)
+            if original is None:
+                return None
+            variant = await loop.run_in_executor(None, _resize_image, original.path, size, fmt)
+            if variant is None:
+                # No Pillow: serve the original for every variant
+                return original
+            body, content_type = variant
+        else:
+            downloaded = await self.http.request_bytes(url, IMAGE_MAX_DOWNLOAD)
+            if downloaded is None:
+                return None
+            body, content_type = downloaded
+            if content_type not in _IMAGE_EXTENSIONS:
+                log.warning("%s is not an image (%s), not caching", url, content_type)
+                return None
+        return await loop.run_in_executor(None, self._store, key, body, content_type)
+
+    def get_blocking(self, url: str, size: Optional[int] = None, fmt: Optional[str] = None) -> Optional[CachedImage]:
+        """``fetch()`` for callers on other threads, such as Flask handlers."""
+        entry = self.lookup(self.key(url, size, fmt))
+        loop = self.loop
+        if entry is not None or loop is None:
+            return entry
+        future = asyncio.run_coroutine_threadsafe(self.fetch(url, size, fmt), loop)
+        try:
+            return future.result(IMAGE_FETCH_TIMEOUT)
+        except Exception as e:
+            api_log.warning("Image download for %s failed: %r", url, e)
+            return None
+
+
+image_cache = ImageCache()
+
+
+def image_source_url(source: str, account_id: str = DEFAULT_ACCOUNT_ID) -> tuple:
+    """Return ``(status, url)`` for an account's "discord", "roblox" or "banner" image."""
+    data = get_profile_data(account_id)
+    if data is None:
+        return 404, None
+    if source == "banner":
+        url = (data.get("discord") or {}).get("banner_url")
+    else:
+        url = (data.get(source) or {}).get("avatar_url")
+    return (200, url) if url else (404, None)
+
+
+def parse_image_variant(size: Optional[str], fmt: Optional[str]) -> tuple:
+    """Validate ?size= and ?format=, ignoring values we don't produce."""
+    size = int(size) if size and size.isdigit() and int(size) in IMAGE_SIZES else None
+    fmt = fmt if fmt in ("webp", "png") else None
+    return size, fmt
+
+
+def image_headers(entry: CachedImage) -> dict:
+    return {"ETag": entry.etag, "Cache-Control": IMAGE_CACHE_CONTROL, "Content-Type": entry.content_type}
+
+
+# ==================== HISTORY ====================
+
+HISTORY_METRICS = {  # metric -> section of the profile it's read from
+    "friends_count": "roblox",
+    "followers_count": "roblox",
+    "following_count": "roblox",
+    "status": "discord",
+}
+
+
+def history_samples(data: dict, metrics=HISTORY_METRICS) -> list:
+    """Pick the tracked ``metrics`` out of a profile as (metric, value) pairs."""
+    samples = []
+    for metric in metrics:
+        value = (data.get(HISTORY_METRICS[metric]) or {}).get(metric)
+        if value is not None:
+            samples.append((metric, value))
+    return samples
+
+
+def _parse_history_time(value: Optional[str]) -> Optional[float]:
+    """Accept Unix seconds or an ISO 8601 timestamp."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    if not math.isfinite(seconds):
+        raise ValueError(f"not a finite time: {value}")
+    return seconds
+
+
+class HistoryStore:
+    """Append-only time series of profile metrics in SQLite.
+
+    Samples live in one WITHOUT ROWID table clustered on
+    (account, metric, time), so a range query is a single index scan. WAL
+    mode lets the API threads read while the bot appends; the writer
+    connection is shared behind a lock and every reading thread opens its
+    own.
+    """
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            " account_id TEXT NOT NULL, metric TEXT NOT NULL, ts REAL NOT NULL, value,"
+            " PRIMARY KEY (account_id, metric, ts)) WITHOUT ROWID"
+        )
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def append(self, account_id: str, samples: list, ts: Optional[float] = None):
+        """Record ``samples`` (from history_samples) taken at ``ts``."""
+        ts = time.time() if ts is None else ts
+        try:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = self._connect()
+                with self._writer:
+                    self._writer.executemany(
+                        "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)",
+                        [(account_id, metric, ts, value) for metric, value in samples],
+                    )
+        except sqlite3.Error as e:
+            log.error("Error recording history for %s: %r", account_id, e)
+
+    def query(self, account_id: str, metric: str, start: Optional[float], end: Optional[float],
+              step: Optional[float]) -> dict:
+        """Return ``metric`` between ``start`` and ``end``, downsampled to HISTORY_MAX_POINTS.
+
+        Each ``step``-second bucket becomes one point carrying its latest
+        value; numeric metrics also carry the bucket's min and max so
+        spikes survive downsampling.
+        """
+        conn = self._reader()
+        end = time.time() if end is None else end
+        if start is None:
+            (start,) = conn.execute(
+                "SELECT MIN(ts) FROM samples WHERE account_id = ? AND metric = ?",
+                (account_id, metric),
+            ).fetchone()
+            start = end if start is None else start
+        span = max(end - start, 0)
+        step = max(step or 0, span / HISTORY_MAX_POINTS, 1)
+
+        rows = conn.execute(
+            "SELECT ts, value, lo, hi FROM ("
+            " SELECT ts, value, MIN(value) OVER bucket AS lo, MAX(value) OVER bucket AS hi,"
+            " ROW_NUMBER() OVER (bucket ORDER BY ts DESC) AS rn"
+            " FROM samples WHERE account_id = :account AND metric = :metric AND ts BETWEEN :start AND :end"
+            " WINDOW bucket AS (PARTITION BY CAST((ts - :start) / :step AS INTEGER))"
+            ") WHERE rn = 1 ORDER BY ts",
+            {"account": account_id, "metric": metric, "start": start, "end": end, "step": step},
+        ).fetchall()
+        if HISTORY_METRICS[metric] == "discord":
+            points = [{"t": round(ts, 3), "value": value} for ts, value, _, _ in rows]
+        else:
+            points = [{"t": round(ts, 3), "value": value, "min": lo, "max": hi} for ts, value, lo, hi in rows]
+        return {
+            "account_id": account_id,
+            "metric": metric,
+            "from": start,
+            "to": end,
+            "step": step,
+            "points": points,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+history_store = HistoryStore()
+
+
+def history_payload(args, account_id: str = DEFAULT_ACCOUNT_ID) -> tuple:
+    """Answer a history query; returns ``(status, payload)`` for either server."""
+    if account_id not in profile_registry.accounts:
+        return 404, {"error": "Unknown account"}
+    metric = args.get("metric")
+    if metric not in HISTORY_METRICS:
+        return 400, {"error": f"metric must be one of: {', '.join(HISTORY_METRICS)}"}
+    try:
+        start = _parse_history_time(args.get("from"))
+        end = _parse_history_time(args.get("to"))
+        step = float(args["step"]) if args.get("step") else None
+    except ValueError:
+        return 400, {"error": "from/to must be Unix seconds or ISO 8601, step a number of seconds"}
+    if step is not None and not (math.isfinite(step) and step > 0):
+        return 400, {"error": "step must be a positive number of seconds"}
+    if start is not None and end is not None and start > end:
+        return 400, {"error": "from is after to"}
+    try:
+        return 200, history_store.query(account_id, metric, start, end, step)
+    except sqlite3.Error as e:
+        api_log.error("History query failed: %r", e)
+        return 503, {"error": "History unavailable"}
+
+
+# ==================== API ONLY ====================
+
+async def _serve_workers(count: int, host: str, port: int):
+    """Run API workers and republish the shared snapshot when a profile file changes."""
+    from profile_api_aiohttp import ApiWorkerPool
+
+    writer = SharedSnapshotWriter()
+    writer.publish()
+    pool = ApiWorkerPool(count, host, port)
+    pool.start()
+    generations = None
+    try:
+        while True:
+            # get() re-reads a file once its mtime moves, e.g. after the bot saved it
+            for snapshot in profile_registry.snapshots.values():
+                snapshot.get()
+            current = tuple(snapshot.generation for snapshot in profile_registry.snapshots.values())
+            if current != generations:
+                if generations is not None:
+                    writer.publish()
+                generations = current
+            await asyncio.sleep(SNAPSHOT_STAT_INTERVAL)
+    finally:
+        pool.stop()
+        writer.close()
+
+
+async def _serve_aiohttp(host: str, port: int):
+    from profile_api_aiohttp import AsyncApiServer
+
+    server = AsyncApiServer(host, port)
+    await server.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    """Serve the saved profiles without the bot (and without importing discord.py)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--server", choices=("flask", "aiohttp", "workers"),
+                        default=API_SERVER if API_SERVER != "none" else "flask")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS)
+    args = parser.parse_args()
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+
+    # Read every profile now so the first request is served from memory
+    for snapshot in profile_registry.snapshots.values():
+        snapshot.get()
+
+    if args.server == "flask":
+        from profile_api_flask import run_flask
+        run_flask(args.host, args.port)
+    elif args.server == "aiohttp":
+        asyncio.run(_serve_aiohttp(args.host, args.port))
+    else:
+        asyncio.run(_serve_workers(args.workers, args.host, args.port))
+
+
+if __name__ == "__main__":
+    # Run main() from the importable module, so this process and the server
+    # modules share one registry instead of two copies of this file
+    import profile_api
+    profile_api.main()
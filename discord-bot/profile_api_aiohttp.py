@@ -0,0 +1,275 @@
+"""
+The profile API on aiohttp: served from the bot's event loop, or from
+API worker processes reading the shared snapshot.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from typing import Optional
+from aiohttp import web
+
+import profile_api
+from profile_api import (
+    API_HOST, API_MAX_CONNECTIONS, API_PORT, API_REJECTIONS, API_WORKERS, CORS_HEADERS,
+    DEFAULT_ACCOUNT_ID, IMAGE_FETCH_TIMEOUT, METRICS_CONTENT_TYPE, NOT_FOUND_BODY, OVERLOADED_BODY,
+    SSE_HEARTBEAT, STREAM_HEARTBEAT, SharedSnapshotReader, _etag_matches, admission, api_log,
+    conditional_response, default_cache_control, health_payload, history_payload, image_cache, image_headers,
+    image_source_url, metrics, observe_request, parse_image_variant, profile_registry, root_payload,
+)
+
+
+# ==================== AIOHTTP SERVER ====================
+
+@web.middleware
+async def _aiohttp_metrics(request: web.Request, handler):
+    started = time.perf_counter()
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        observe_request(route, e.status, started)
+        raise
+    observe_request(route, response.status, started)
+    return response
+
+
+@web.middleware
+async def _aiohttp_cors(request: web.Request, handler):
+    """Answer preflights and add the same CORS headers as the Flask server."""
+    if request.method == 'OPTIONS' and request.path.startswith('/api/'):
+        response = web.Response(status=204)
+    else:
+        response = await handler(request)
+    if not response.prepared:
+        # Streams send their headers themselves before the handler returns
+        response.headers.update(CORS_HEADERS)
+        response.headers.setdefault('Cache-Control', default_cache_control(response.status))
+    return response
+
+
+def _aiohttp_section(section: Optional[str]):
+    """Build a handler for ``section``; None takes it from the URL instead."""
+    async def handler(request: web.Request) -> web.Response:
+        status, headers, body = conditional_response(
+            section or request.match_info.get("section", "profile"),
+            request.headers,
+            request.match_info.get("account_id", DEFAULT_ACCOUNT_ID),
+            request.query.get("fields"),
+        )
+        return web.Response(body=body or None, status=status, headers=headers)
+    return handler
+
+
+async def _aiohttp_stream(request: web.Request) -> web.StreamResponse:
+    snapshot = profile_registry.get(request.match_info.get("account_id", DEFAULT_ACCOUNT_ID))
+    if snapshot is None:
+        return web.Response(body=NOT_FOUND_BODY, status=404, content_type="application/json")
+    
+    broadcaster = snapshot.broadcaster()
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    
+    def notify():
+        # Publishes usually happen on this loop; only hop threads when they don't
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            wake.set()
+        else:
+            loop.call_soon_threadsafe(wake.set)
+    
+    subscriber = broadcaster.subscribe(notify)
+    if subscriber is None:
+        return web.json_response({"error": "Too many stream subscribers"}, status=503)
+    
+    response = web.StreamResponse(headers={
+        **CORS_HEADERS,
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    try:
+        await response.prepare(request)
+        while not subscriber.closed:
+            wake.clear()
+            for frame in broadcaster.drain(subscriber):
+                await response.write(frame)
+            try:
+                await asyncio.wait_for(wake.wait(), STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await response.write(SSE_HEARTBEAT)
+    except ConnectionResetError:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscriber)
+    return response
+
+
+async def _aiohttp_image(request: web.Request) -> web.StreamResponse:
+    source = request.match_info.get("source", "banner")
+    status, url = image_source_url(source, request.query.get("account", DEFAULT_ACCOUNT_ID))
+    if url is None:
+        return web.json_response({"error": "No image available"}, status=status)
+    
+    size, fmt = parse_image_variant(request.query.get("size"), request.query.get("format"))
+    try:
+        entry = await asyncio.wait_for(image_cache.fetch(url, size, fmt), IMAGE_FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        entry = None
+    if entry is None:
+        raise web.HTTPFound(url)
+    
+    headers = image_headers(entry)
+    if _etag_matches(request.headers.get("If-None-Match") or "", entry.etag):
+        return web.Response(status=304, headers=headers)
+    # FileResponse hands the file to the kernel with sendfile()
+    return web.FileResponse(entry.path, headers=headers)
+
+
+async def _aiohttp_history(request: web.Request) -> web.Response:
+    # SQLite is blocking; keep it off the bot's loop
+    status, payload = await asyncio.get_running_loop().run_in_executor(
+        None, history_payload, request.query, request.match_info.get("account_id", DEFAULT_ACCOUNT_ID)
+    )
+    return web.json_response(payload, status=status)
+
+
+async def _aiohttp_metrics_endpoint(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render(), headers={
+        "Content-Type": METRICS_CONTENT_TYPE,
+        "Cache-Control": "no-store",
+    })
+
+
+async def _aiohttp_health(request: web.Request) -> web.Response:
+    return web.json_response(health_payload())
+
+
+async def _aiohttp_root(request: web.Request) -> web.Response:
+    return web.json_response(root_payload())
+
+
+class AsyncApiServer:
+    """Serves the profile API from aiohttp on the bot's own event loop.
+
+    Handlers run on the loop that refreshes the data, so they read the
+    snapshot the cog just published with no thread hand-off, and idle
+    keep-alive connections cost a socket rather than a thread.
+
+    With ``worker=True`` it runs in an API worker process instead: the
+    listening port is shared with the other workers through SO_REUSEPORT,
+    and the routes that need the bot's loop (streams, images) are left out.
+    """
+
+    def __init__(self, host: str = API_HOST, port: int = API_PORT, worker: bool = False):
+        self.host = host
+        self.port = port
+        self.worker = worker
+        # Admission runs inside CORS so rejections still reach browsers readably
+        self.app = web.Application(middlewares=[_aiohttp_metrics, _aiohttp_cors, self._admission])
+        self.app.router.add_get('/', _aiohttp_root)
+        self.app.router.add_get('/metrics', _aiohttp_metrics_endpoint)
+        self.app.router.add_get('/api/health', _aiohttp_health)
+        self.app.router.add_get('/api/profile', _aiohttp_section("profile"))
+        self.app.router.add_get('/api/profile/discord', _aiohttp_section("discord"))
+        self.app.router.add_get('/api/profile/roblox', _aiohttp_section("roblox"))
+        self.app.router.add_get('/api/profile/history', _aiohttp_history)
+        if not worker:
+            self.app.router.add_get('/api/profile/stream', _aiohttp_stream)
+            self.app.router.add_get('/api/avatar/{source:discord|roblox}', _aiohttp_image)
+            self.app.router.add_get('/api/banner', _aiohttp_image)
+            self.app.router.add_get('/api/profile/{account_id}/stream', _aiohttp_stream)
+        self.app.router.add_get('/api/profile/{account_id}/history', _aiohttp_history)
+        self.app.router.add_get('/api/profile/{account_id}', _aiohttp_section(None))
+        self.app.router.add_get('/api/profile/{account_id}/{section:discord|roblox}', _aiohttp_section(None))
+        self.runner: Optional[web.AppRunner] = None
+
+    @web.middleware
+    async def _admission(self, request: web.Request, handler):
+        """Turn the request away before its handler runs, see profile_api.Admission.
+
+        Idle connections cost aiohttp no thread, so ones over
+        API_MAX_CONNECTIONS are closed on their first request rather than
+        on accept.
+        """
+        if self.runner and len(self.runner.server.connections) > API_MAX_CONNECTIONS:
+            API_REJECTIONS.inc("connections")
+            response = web.Response(body=OVERLOADED_BODY, status=503, content_type="application/json",
+                                    headers={"Retry-After": "1"})
+            response.force_close()
+            return response
+        
+        stream = request.path.endswith("/stream")
+        rejection = admission.admit(admission.client(request.remote, request.headers), in_flight=not stream)
+        if rejection is not None:
+            status, headers, body = rejection
+            return web.Response(body=body, status=status, headers=headers)
+        if stream:
+            return await handler(request)
+        try:
+            return await handler(request)
+        finally:
+            admission.release()
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port, reuse_address=True, reuse_port=self.worker)
+        await site.start()
+        api_log.info("aiohttp server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        """Stop accepting connections and let in-flight requests finish."""
+        if self.runner:
+            # Streams never end on their own; ask them to finish first
+            profile_registry.close_streams()
+            await self.runner.cleanup()
+            self.runner = None
+            api_log.info("aiohttp server stopped")
+
+
+def run_api_worker(host: str = API_HOST, port: int = API_PORT):
+    """Entry point of one API worker process, serving from the shared snapshot."""
+    profile_api.shared_reader = SharedSnapshotReader()
+
+    async def serve():
+        await AsyncApiServer(host, port, worker=True).start()
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+
+class ApiWorkerPool:
+    """API_WORKERS processes running ``run_api_worker`` on the same port.
+
+    The kernel spreads connections across them (SO_REUSEPORT), so the API
+    gets its own cores and its own GIL, apart from the discord.py client.
+    Workers are spawned rather than forked; forking a process with a
+    running event loop and threads isn't safe.
+    """
+
+    def __init__(self, count: int = API_WORKERS, host: str = API_HOST, port: int = API_PORT):
+        self.count = count
+        self.host = host
+        self.port = port
+        self.processes: list = []
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        for number in range(self.count):
+            process = context.Process(
+                target=run_api_worker, args=(self.host, self.port), name=f"profile-api-{number}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        api_log.info("Started %d API workers on %s:%s", self.count, self.host, self.port)
+
+    def stop(self, timeout: float = 5):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
@@ -0,0 +1,224 @@
+"""
+The profile API on Flask: a threaded Werkzeug server, run next to the bot
+or on its own from profile_api.py.
+"""
+
+import threading
+import time
+from flask import Flask, Response, g, jsonify, redirect, request, send_file
+from flask_cors import CORS
+from werkzeug.serving import ThreadedWSGIServer
+
+from profile_api import (
+    API_HOST, API_MAX_CONNECTIONS, API_PORT, API_REJECTIONS, CORS_HEADERS, DEFAULT_ACCOUNT_ID,
+    METRICS_CONTENT_TYPE, NOT_FOUND_BODY, SSE_HEARTBEAT, STREAM_HEARTBEAT, _etag_matches, admission, api_log,
+    conditional_response, default_cache_control, health_payload, history_payload, image_cache, image_headers,
+    image_source_url, metrics, observe_request, parse_image_variant, profile_registry, root_payload,
+)
+
+# Flask app for API
+api_app = Flask(__name__)
+CORS(api_app, resources={
+    r"/api/*": {
+        "origins": "*",
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"]
+    }
+})
+
+
+# ==================== FLASK SERVER ====================
+
+def serve_prepared(section: str, account_id: str = DEFAULT_ACCOUNT_ID) -> Response:
+    """Build a Flask response for ``section``."""
+    status, headers, body = conditional_response(section, request.headers, account_id, request.args.get("fields"))
+    return Response(body, status=status, headers=headers)
+
+
+@api_app.before_request
+def before_request():
+    g.request_started = time.perf_counter()
+    # Turn the request away before routing or reading anything it asks for
+    rejection = admission.admit(admission.client(request.remote_addr, request.headers))
+    if rejection is not None:
+        status, headers, body = rejection
+        return Response(body, status=status, headers=headers)
+    g.admitted = True
+
+
+@api_app.teardown_request
+def teardown_request(exc):
+    if g.pop("admitted", False):
+        admission.release()
+
+
+@api_app.after_request
+def after_request(response):
+    """Add CORS headers to all responses and record request metrics."""
+    for name, value in CORS_HEADERS.items():
+        response.headers.add(name, value)
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = default_cache_control(response.status_code)
+    # The route template, not the path, keeps label cardinality bounded
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe_request(route, response.status_code, g.get("request_started", time.perf_counter()))
+    return response
+
+
+@api_app.route('/api/profile', methods=['GET', 'OPTIONS'])
+def profile_endpoint():
+    """API endpoint to get full profile data."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    return serve_prepared("profile")
+
+
+@api_app.route('/api/profile/discord', methods=['GET', 'OPTIONS'])
+def discord_endpoint():
+    """API endpoint to get Discord data only."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    return serve_prepared("discord")
+
+
+@api_app.route('/api/profile/roblox', methods=['GET', 'OPTIONS'])
+def roblox_endpoint():
+    """API endpoint to get Roblox data only."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    return serve_prepared("roblox")
+
+
+@api_app.route('/api/profile/stream', methods=['GET'])
+@api_app.route('/api/profile/<account_id>/stream', methods=['GET'])
+def stream_endpoint(account_id: str = DEFAULT_ACCOUNT_ID):
+    """Server-Sent Events stream: the full profile, then JSON-patch deltas.
+    
+    Each client holds a Werkzeug thread here; use API_SERVER = "aiohttp"
+    for large numbers of subscribers.
+    """
+    snapshot = profile_registry.get(account_id)
+    if snapshot is None:
+        return Response(NOT_FOUND_BODY, status=404, mimetype="application/json")
+    
+    broadcaster = snapshot.broadcaster()
+    wake = threading.Event()
+    subscriber = broadcaster.subscribe(wake.set)
+    if subscriber is None:
+        return jsonify({"error": "Too many stream subscribers"}), 503
+    
+    def events():
+        try:
+            while not subscriber.closed:
+                wake.clear()
+                yield from broadcaster.drain(subscriber)
+                if not wake.wait(STREAM_HEARTBEAT):
+                    yield SSE_HEARTBEAT
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@api_app.route('/api/profile/<account_id>', methods=['GET', 'OPTIONS'])
+@api_app.route('/api/profile/<account_id>/<any(discord, roblox):section>', methods=['GET', 'OPTIONS'])
+def account_endpoint(account_id: str, section: str = "profile"):
+    """API endpoint to get the profile of any tracked account."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    
+    return serve_prepared(section, account_id)
+
+
+@api_app.route('/api/profile/history', methods=['GET'])
+@api_app.route('/api/profile/<account_id>/history', methods=['GET'])
+def history_endpoint(account_id: str = DEFAULT_ACCOUNT_ID):
+    """Time series of a metric: ?metric=followers_count&from=&to=&step="""
+    status, payload = history_payload(request.args, account_id)
+    return jsonify(payload), status
+
+
+@api_app.route('/api/avatar/<any(discord, roblox):source>', methods=['GET'])
+@api_app.route('/api/banner', methods=['GET'], defaults={"source": "banner"})
+def image_endpoint(source: str):
+    """Serve an avatar or banner from the local image cache."""
+    status, url = image_source_url(source, request.args.get("account", DEFAULT_ACCOUNT_ID))
+    if url is None:
+        return jsonify({"error": "No image available"}), status
+    
+    size, fmt = parse_image_variant(request.args.get("size"), request.args.get("format"))
+    entry = image_cache.get_blocking(url, size, fmt)
+    if entry is None:
+        return redirect(url, code=302)
+    
+    headers = image_headers(entry)
+    if _etag_matches(request.headers.get("If-None-Match") or "", entry.etag):
+        return Response(status=304, headers=headers)
+    try:
+        # Opened before anything else, so a later eviction can't unlink it from under send_file
+        image = open(entry.path, 'rb')
+    except FileNotFoundError:
+        # Evicted since the lookup; treat it as a miss
+        return redirect(url, code=302)
+    response = send_file(image, mimetype=entry.content_type, conditional=False, etag=False)
+    response.headers.update(headers)
+    return response
+
+
+@api_app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE, headers={"Cache-Control": "no-store"})
+
+
+@api_app.route('/api/health', methods=['GET'])
+def health_check():
+    """Health check endpoint."""
+    return jsonify(health_payload())
+
+
+@api_app.route('/', methods=['GET'])
+def root():
+    """Root endpoint with API info."""
+    return jsonify(root_payload())
+
+
+class LimitedWSGIServer(ThreadedWSGIServer):
+    """Werkzeug's thread-per-connection server, capped at API_MAX_CONNECTIONS threads.
+
+    A connection over the cap is closed as soon as it's accepted, so a
+    client holding connections open can't claim every thread.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._slots = threading.BoundedSemaphore(API_MAX_CONNECTIONS)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            API_REJECTIONS.inc("connections")
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._slots.release()
+
+
+def run_flask(host: str = API_HOST, port: int = API_PORT):
+    """Serve the API with Flask; blocks, so the bot runs it in a separate thread."""
+    api_log.info("Starting Flask server on %s:%s", host, port)
+    LimitedWSGIServer(host, port, api_app).serve_forever()
@@ -10,137 +10,954 @@ import discord
 from discord.ext import commands, tasks
 from discord import app_commands
 import aiohttp
+import io
 import json
+import logging
 import os
-from datetime import datetime, timedelta
-from typing import Optional
+import random
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
 import asyncio
+import base64
+import hashlib
+import heapq
+import sqlite3
 import threading
-from flask import Flask, jsonify, request
-from flask_cors import CORS
-
-# Update these with your IDs
-DISCORD_USER_ID = 822804221425614903
-ROBLOX_USER_ID = 1610763045
-DATA_FILE = "profile_data.json"
-UPDATE_INTERVAL_DAYS = 2
-API_PORT = 25566
-API_HOST = "0.0.0.0"
-
-# Flask app for API
-api_app = Flask(__name__)
-CORS(api_app, resources={
-    r"/api/*": {
-        "origins": "*",
-        "methods": ["GET", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"]
-    }
-})
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from profile_api import (
+    API_HOST, API_PORT, API_SERVER, DEFAULT_ACCOUNT_ID, DISCORD_USER_ID, HISTORY_METRICS, LOG_LEVEL,
+    LOOP_LAG, ROBLOX_USER_ID, UPSTREAM_LATENCY, UPSTREAM_RESPONSES, UPSTREAM_RETRIES, DiscordProfile,
+    ProfileWriter, RobloxProfile, SharedSnapshotWriter, TrackedAccount, _file_mtime,
+    default_profile, history_samples, history_store, image_cache, log, profile_registry, profile_snapshot,
+)
+
+FETCH_TIMEOUT = 8  # Seconds allowed for each upstream request during a refresh
+HTTP_POOL_SIZE = 32  # Open connections kept across all upstream hosts
+HTTP_POOL_PER_HOST = 8
+HTTP_DNS_TTL = 300  # Seconds DNS answers are cached
+HTTP_KEEPALIVE = 30  # Seconds idle upstream connections are kept open
+HTTP_MAX_RETRIES = 3  # Retries after the first attempt on 429 / 5xx / network errors
+HTTP_BACKOFF_BASE = 0.5  # Seconds; doubled per retry, with full jitter
+HTTP_BACKOFF_MAX = 10
+HTTP_REQUEST_DEADLINE = 20  # Seconds one request may spend across all its retries
+HOST_RATE_LIMITS = {  # host -> (requests per second, burst)
+    "default": (10, 20),
+    "friends.roblox.com": (5, 10),
+}
+UPSTREAM_OVERRIDES: dict = {}  # host -> base URL its requests go to instead, e.g. local stubs in bench_profile_api.py
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures before a host's circuit opens
+BREAKER_RESET_TIMEOUT = 60  # Seconds an open circuit waits before letting a probe through
+ROBLOX_BATCH_WINDOW = 0.05  # Seconds to wait for more Roblox lookups before sending a batch
+ROBLOX_BATCH_SIZE = 100  # Most user IDs Roblox accepts in one batched request
+ROBLOX_DETAILS_MAX_AGE = 7 * 24 * 3600  # Seconds before description/created/is_banned are refetched
+REFRESH_CONCURRENCY = 8  # Accounts refreshed at the same time
+PROFILE_FRESHNESS = 600  # Seconds commands answer from cached data before revalidating it in the background
+LOOP_LAG_INTERVAL = 1.0  # Seconds between event-loop lag samples
+REFRESH_CALL_BUDGET = 3.0  # Upstream calls per tracked account per day for scheduled refreshes (the old 2-day full refresh used 3)
+SCHEDULER_TICK = 60  # Seconds between checks for due refreshes
+UPSTREAM_CACHE_FILE = "upstream_cache.db"  # Upstream responses kept for conditional requests
+UPSTREAM_CACHE_MAX_BYTES = 4 * 1024 * 1024
+# "live", "record" (also save every upstream response to UPSTREAM_RECORDINGS_DIR)
+# or "replay" (serve upstream responses only from it, for offline development and profiling)
+UPSTREAM_MODE = os.getenv("PROFILE_UPSTREAM_MODE", "live")
+UPSTREAM_RECORDINGS_DIR = "upstream_recordings"
+UPSTREAM_REPLAY_LATENCY = 0.05  # Seconds each replayed response takes, standing in for the round trip
+COMMAND_COOLDOWN = 5  # Seconds a user waits between uses of a command
+FORCEUPDATE_COOLDOWN = 60  # forceupdate always goes upstream, so it waits longer
+
+
+# ==================== OUTBOUND HTTP ====================
+
+class TokenBucket:
+    """Token-bucket limiter: ``rate`` requests per second with bursts of ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1) -> bool:
+        """Take ``cost`` tokens if they're available now, without waiting."""
+        self._refill()
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+    async def acquire(self):
+        """Take one token, sleeping until one is available."""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures.
+
+    After ``threshold`` consecutive failures the circuit opens and requests
+    fail fast for ``reset_timeout`` seconds. Then a single probe is let
+    through; its outcome closes the circuit or re-opens it.
+    """
+
+    def __init__(self, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            self.probing = True
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def end_probe(self):
+        """Forget a probe that ended without recording an outcome."""
+        self.probing = False
+
+
+def _upstream_url(url: str) -> str:
+    """Apply UPSTREAM_OVERRIDES, keeping the path and query."""
+    parts = urlsplit(url)
+    base = UPSTREAM_OVERRIDES.get(parts.hostname)
+    if base is None:
+        return url
+    return base.rstrip("/") + url[len(f"{parts.scheme}://{parts.netloc}"):]
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class CachedResponse:
+    """An upstream body kept by UpstreamCache with its validators, parsed at most once."""
+
+    __slots__ = ("body", "etag", "last_modified", "_data")
+
+    def __init__(self, body: bytes, etag: Optional[str], last_modified: Optional[str]):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self._data = None
+
+    def validators(self) -> dict:
+        """Headers that make a request for this body conditional."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def json(self):
+        if self._data is None:
+            self._data = json.loads(self.body)
+        return self._data
+
+
+class UpstreamCache:
+    """Persistent, size-bounded cache of upstream GET responses, keyed by URL.
+
+    Only responses with an ETag or Last-Modified are kept, since those are
+    what let the next refresh ask "changed since?"; on a 304 the cached
+    body is reused without downloading or parsing it again. Entries are
+    held in memory in LRU order up to ``max_bytes`` of bodies and written
+    through to SQLite off the event loop, so they survive restarts. Writes
+    go through one worker thread in the order they were made, so two
+    responses for the same URL can't land out of order; hits only update
+    ``used`` along with the next write, and ``close()`` flushes them.
+    """
+
+    def __init__(self, path: str = UPSTREAM_CACHE_FILE, max_bytes: int = UPSTREAM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._touched: dict = {}  # url -> time of hits not yet written
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upstream-cache")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB NOT NULL, used REAL NOT NULL)"
+        )
+        return conn
+
+    def _load(self):
+        try:
+            self._conn = self._connect()
+            rows = self._conn.execute(
+                "SELECT url, etag, last_modified, body FROM responses ORDER BY used"
+            ).fetchall()
+        except sqlite3.Error as e:
+            log.error("Error opening upstream cache %s: %r", self.path, e)
+            self._conn = None
+            return
+        evicted = []
+        for url, etag, last_modified, body in rows:
+            evicted += self._insert(url, CachedResponse(body, etag, last_modified))
+        if evicted:
+            # max_bytes shrank since the last run
+            self._write(None, None, evicted, {})
+
+    def _insert(self, url: str, entry: CachedResponse) -> list:
+        """Add ``entry`` in memory and return the URLs evicted to make room."""
+        previous = self._entries.pop(url, None)
+        if previous is not None:
+            self.size -= len(previous.body)
+        self._entries[url] = entry
+        self.size += len(entry.body)
+        evicted = []
+        while self.size > self.max_bytes:
+            old_url, old = self._entries.popitem(last=False)
+            self.size -= len(old.body)
+            evicted.append(old_url)
+        return evicted
+
+    def _write(self, url: Optional[str], entry: Optional[CachedResponse], evicted: list, touched: dict):
+        try:
+            with self._lock:
+                if self._conn is None:
+                    return
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE responses SET used = ? WHERE url = ?",
+                        [(used, hit) for hit, used in touched.items()],
+                    )
+                    if url is not None and url not in evicted:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                            (url, entry.etag, entry.last_modified, entry.body, touched[url]),
+                        )
+                    self._conn.executemany("DELETE FROM responses WHERE url = ?", [(old,) for old in evicted])
+        except sqlite3.Error as e:
+            log.error("Error writing upstream cache %s: %r", self.path, e)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+            self._touched[url] = time.time()
+        return entry
+
+    def put(self, url: str, body: bytes, headers) -> Optional[CachedResponse]:
+        """Cache ``body`` if ``headers`` carry a validator; return the entry, or None if not kept."""
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not (etag or last_modified) or len(body) > self.max_bytes:
+            return None
+        entry = CachedResponse(body, etag, last_modified)
+        evicted = self._insert(url, entry)
+        if self._conn is not None:
+            # Stamped now, not when the writer gets to it, so the LRU order reloads as it was
+            self._touched[url] = time.time()
+            touched, self._touched = self._touched, {}
+            self._writer.submit(self._write, url, entry, evicted, touched)
+        return entry
+
+    def close(self):
+        """Write out pending hits, wait for queued writes and close the database."""
+        if self._conn is not None:
+            touched, self._touched = self._touched, {}
+            self._writer.submit(self._write, None, None, [], touched)
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RecordedResponse:
+    """Stands in for an aiohttp response read back from (or just saved to) a recording."""
+
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.content = self  # request_bytes reads resp.content.read(n)
+        self.content_length = len(body)
+        self.content_type = headers.get("Content-Type", "application/octet-stream").split(";")[0].strip()
+
+    async def read(self, n: int = -1) -> bytes:
+        return self.body if n < 0 else self.body[:n]
+
+    async def json(self):
+        return json.loads(self.body)
+
+
+class UpstreamRecordings:
+    """Upstream responses saved to a directory ("record") and served back from it ("replay").
+
+    Each request is one JSON file named by a hash of its method, URL and
+    payload, so a recorded refresh replays without any network access.
+    Discord users, which discord.py fetches rather than OutboundClient,
+    are kept the same way through ``record_json``/``replay_json``.
+    Replayed responses arrive after ``latency`` seconds to stand in for the
+    real round trip; a request that was never recorded fails like an
+    unreachable host.
+    """
+
+    HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, mode: str, directory: str = UPSTREAM_RECORDINGS_DIR,
+                 latency: float = UPSTREAM_REPLAY_LATENCY):
+        self.replaying = mode == "replay"
+        self.directory = directory
+        self.latency = latency
+
+    def _path(self, method: str, url: str, payload: Optional[dict]) -> str:
+        key = json.dumps([method, url, payload], sort_keys=True).encode()
+        return os.path.join(self.directory, f"{hashlib.blake2b(key, digest_size=16).hexdigest()}.json")
+
+    def _save(self, path: str, recording: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(recording, f, indent=2)
+
+    async def _store(self, method: str, url: str, payload: Optional[dict], status: int, headers: dict, body: bytes):
+        recording = {
+            "method": method,
+            "url": url,
+            "payload": payload,
+            "status": status,
+            "headers": headers,
+            "body": base64.b64encode(body).decode(),
+        }
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._save, self._path(method, url, payload), recording
+        )
+
+    async def record(self, method: str, url: str, payload: Optional[dict], resp) -> RecordedResponse:
+        """Save ``resp`` and return a copy that can still be read."""
+        body = await resp.read()
+        headers = {name: resp.headers[name] for name in self.HEADERS if name in resp.headers}
+        await self._store(method, url, payload, resp.status, headers, body)
+        return RecordedResponse(resp.status, headers, body)
+
+    async def record_json(self, url: str, data):
+        """Save ``data``, fetched from ``url`` by something other than OutboundClient."""
+        await self._store("GET", url, None, 200, {"Content-Type": "application/json"}, json.dumps(data).encode())
+
+    async def replay_json(self, url: str):
+        """Return what ``record_json`` saved for ``url``, or None if nothing was."""
+        resp = await self.replay("GET", url, None)
+        return await resp.json() if resp is not None and resp.status == 200 else None
+
+    async def replay(self, method: str, url: str, payload: Optional[dict]) -> Optional[RecordedResponse]:
+        await asyncio.sleep(self.latency)
+        try:
+            with open(self._path(method, url, payload)) as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            log.warning("No recording of %s %s", method, url)
+            return None
+        return RecordedResponse(recording["status"], recording["headers"], base64.b64decode(recording["body"]))
+
+
+class OutboundClient:
+    """Shared HTTP client for all upstream fetches.
+
+    One pooled session with DNS caching and keep-alive, a token bucket and
+    a circuit breaker per host, and retries with jittered exponential
+    backoff (honouring Retry-After) on 429, 5xx and network errors.
+    Failures come back as None so callers can keep their last known value.
+
+    With a ``cache``, JSON GETs are sent conditionally and a 304 reuses the
+    cached result. With ``recordings``, responses are recorded to disk or,
+    when replaying, served from it instead of the network.
+    """
+
+    def __init__(self, cache: Optional[UpstreamCache] = None, recordings: Optional[UpstreamRecordings] = None):
+        self.cache = cache
+        self.recordings = recordings
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._buckets: dict = {}
+        self._breakers: dict = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                limit_per_host=HTTP_POOL_PER_HOST,
+                ttl_dns_cache=HTTP_DNS_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(*HOST_RATE_LIMITS.get(host, HOST_RATE_LIMITS["default"]))
+            self._buckets[host] = bucket
+        return bucket
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            self._breakers[host] = breaker
+        return breaker
+
+    async def request_json(self, url: str, method: str = "GET", payload: Optional[dict] = None) -> Optional[dict]:
+        """Request ``url`` and return its JSON body, or None if it never succeeded."""
+        if method != "GET" or self.cache is None:
+            return await self.request(url, method, payload, read=lambda resp: resp.json())
+        cached = self.cache.get(url)
 
+        async def read(resp):
+            if resp.status == 304:
+                # Unchanged: nothing was downloaded and nothing is parsed again
+                return cached.json()
+            body = await resp.read()
+            entry = self.cache.put(url, body, resp.headers)
+            return entry.json() if entry else json.loads(body)
+        return await self.request(url, headers=cached.validators() if cached else None, read=read)
 
-def get_profile_data():
-    """Load profile data from JSON file for API."""
-    if os.path.exists(DATA_FILE):
+    async def request_bytes(self, url: str, max_bytes: int) -> Optional[tuple]:
+        """Download ``url`` and return ``(body, content_type)``, or None.
+
+        Bodies larger than ``max_bytes`` are rejected rather than buffered.
+        """
+        async def read(resp):
+            if resp.content_length and resp.content_length > max_bytes:
+                log.warning("%s is larger than %d bytes, not downloading", url, max_bytes)
+                return None
+            body = await resp.content.read(max_bytes + 1)
+            if len(body) > max_bytes:
+                log.warning("%s is larger than %d bytes, not downloading", url, max_bytes)
+                return None
+            return body, resp.content_type
+        return await self.request(url, read=read)
+
+    async def request(self, url: str, method: str = "GET", payload: Optional[dict] = None, *,
+                      headers: Optional[dict] = None, read) -> Optional[object]:
+        """Request ``url`` with retries and return ``await read(resp)`` for the 200 response.
+
+        A 304 to conditional ``headers`` is handed to ``read`` as well.
+        """
+        if self.recordings is not None and self.recordings.replaying:
+            resp = await self.recordings.replay(method, url, payload)
+            return await read(resp) if resp is not None and resp.status == 200 else None
+        recorded_url = url
+        host = urlsplit(url).hostname or ""
+        url = _upstream_url(url)
+        breaker = self.breaker(host)
+        deadline = time.monotonic() + HTTP_REQUEST_DEADLINE
+        session = await self.get_session()
+
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            if not breaker.allow():
+                log.warning("Circuit open for %s, skipping %s", host, url)
+                return None
+            try:
+                await self.bucket(host).acquire()
+
+                retry_after = None
+                status = None
+                started = time.perf_counter()
+                try:
+                    async with session.request(method, url, json=payload, headers=headers) as resp:
+                        status = resp.status
+                        UPSTREAM_RESPONSES.inc(host, status)
+                        UPSTREAM_LATENCY.observe(time.perf_counter() - started, host)
+                        if resp.status == 200 or (resp.status == 304 and headers):
+                            if self.recordings is not None and resp.status == 200:
+                                resp = await self.recordings.record(method, recorded_url, payload, resp)
+                            data = await read(resp)
+                            breaker.record_success()
+                            return data
+                        if resp.status == 429:
+                            # Throttled, not broken: the host is up, so just back off
+                            breaker.record_success()
+                            retry_after = _retry_after(resp.headers.get("Retry-After"))
+                        elif resp.status >= 500:
+                            breaker.record_failure()
+                        else:
+                            # A definite answer (404 and friends); retrying won't change it
+                            breaker.record_success()
+                            log.warning("%s returned %s", url, resp.status)
+                            return None
+                        log.warning("%s returned %s (attempt %d)", url, resp.status, attempt + 1)
+                except Exception as e:
+                    breaker.record_failure()
+                    if status is None:
+                        UPSTREAM_RESPONSES.inc(host, "error")
+                        UPSTREAM_LATENCY.observe(time.perf_counter() - started, host)
+                    log.warning("Error fetching %s (attempt %d): %r", url, attempt + 1, e)
+            finally:
+                # Cancelled mid-probe there's no outcome; let a later request probe instead
+                breaker.end_probe()
+
+            if attempt == HTTP_MAX_RETRIES:
+                break
+            delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay > deadline:
+                break
+            UPSTREAM_RETRIES.inc(host)
+            await asyncio.sleep(delay)
+
+        return None
+
+
+# ==================== ROBLOX CLIENT ====================
+
+class BatchCoalescer:
+    """Collects single-key lookups and resolves them with one batched call.
+
+    The first ``get()`` opens a window of ``window`` seconds (or until
+    ``max_size`` keys are pending); every lookup made in that window shares
+    one call to ``fetch_batch(keys) -> {key: result}``. Keys missing from
+    the result, or a failed batch, resolve to None.
+    """
+
+    def __init__(self, fetch_batch, window: float = ROBLOX_BATCH_WINDOW, max_size: int = ROBLOX_BATCH_SIZE):
+        self.fetch_batch = fetch_batch
+        self.window = window
+        self.max_size = max_size
+        self._pending: dict = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def get(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        # Shielded so one cancelled caller doesn't cancel the lookup for the rest
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: dict):
         try:
-            with open(DATA_FILE, 'r') as f:
-                return json.load(f)
+            # Sorted, so the same keys always make the same request (and recording)
+            results = await self.fetch_batch(sorted(batch))
         except Exception as e:
-            print(f"Error loading profile data: {e}")
-    
-    # Return default data if file doesn't exist
-    return {
-        "last_update": datetime.now().isoformat(),
-        "discord": {
-            "user_id": str(DISCORD_USER_ID),
-            "username": "Realice",
-            "display_name": "David",
-            "avatar_url": None,
-            "status": "online",
-            "custom_status": "Life to no Limits"
-        },
-        "roblox": {
-            "user_id": ROBLOX_USER_ID,
-            "username": "temix100000",
-            "display_name": "Realice",
-            "avatar_url": None,
-            "friends_count": 0,
-            "followers_count": 0,
-            "following_count": 0
+            log.error("Batched lookup of %d key(s) failed: %r", len(batch), e)
+            results = {}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+class RobloxClient:
+    """Roblox API calls for all tracked accounts, batched where Roblox allows it.
+
+    User lookups and avatar headshots from any number of accounts are
+    coalesced into multi-ID requests. The batched users endpoint only
+    returns names, so the per-user document (description, created,
+    isBanned) is fetched separately via ``get_user_details``. Friend counts
+    have no batch endpoint and stay one request per user.
+    """
+
+    def __init__(self, fetch_json):
+        # fetch_json(url, method="GET", payload=None) -> Optional[dict]
+        self.fetch_json = fetch_json
+        self._users = BatchCoalescer(self._fetch_users)
+        self._headshots = BatchCoalescer(self._fetch_headshots)
+
+    async def _fetch_users(self, user_ids: list) -> dict:
+        data = await self.fetch_json(
+            "https://users.roblox.com/v1/users",
+            method="POST",
+            payload={"userIds": user_ids, "excludeBannedUsers": False},
+        )
+        return {user["id"]: user for user in (data or {}).get("data", [])}
+
+    async def _fetch_headshots(self, user_ids: list) -> dict:
+        ids = ",".join(str(user_id) for user_id in user_ids)
+        # 420x420 for best quality
+        data = await self.fetch_json(
+            f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={ids}&size=420x420&format=Png&isCircular=false"
+        )
+        return {
+            thumb["targetId"]: thumb.get("imageUrl")
+            for thumb in (data or {}).get("data", [])
+            if thumb.get("state") in (None, "Completed")
         }
+
+    async def get_user(self, user_id: int) -> Optional[dict]:
+        """Return ``{"id", "name", "displayName"}`` for a user, batched."""
+        return await self._users.get(user_id)
+
+    async def get_headshot_url(self, user_id: int) -> Optional[str]:
+        """Return the avatar headshot URL for a user, batched."""
+        return await self._headshots.get(user_id)
+
+    async def get_user_details(self, user_id: int) -> Optional[dict]:
+        """Return the full user document, including description and created."""
+        return await self.fetch_json(f"https://users.roblox.com/v1/users/{user_id}")
+
+    async def get_count(self, user_id: int, kind: str) -> Optional[int]:
+        """Return the friends, followers or followings count for a user."""
+        data = await self.fetch_json(f"https://friends.roblox.com/v1/users/{user_id}/{kind}/count")
+        return data.get("count", 0) if data else None
+
+
+# ==================== REFRESH SCHEDULER ====================
+
+class SourcePolicy(NamedTuple):
+    """How often one data source of an account may be refreshed."""
+    ttl: float  # Seconds between refreshes to start from
+    min_ttl: float
+    max_ttl: float
+    cost: int  # Upstream calls one refresh takes, charged against the call budget
+
+
+# Starting TTLs fit within REFRESH_CALL_BUDGET (daily_refresh_cost() is about 2.6);
+# shorter ones are only reached on what quieter sources save by backing off
+REFRESH_SOURCES = {
+    # Names, avatar and banner; status also arrives through gateway events
+    "discord": SourcePolicy(2 * 24 * 3600, 6 * 3600, 7 * 24 * 3600, 1),
+    # Names and avatar headshot, from the batched Roblox lookups
+    "roblox": SourcePolicy(4 * 24 * 3600, 24 * 3600, 14 * 24 * 3600, 2),
+    "roblox_counts": SourcePolicy(2 * 24 * 3600, 6 * 3600, 7 * 24 * 3600, 3),
+    # Description, created and is_banned hardly ever change
+    "roblox_details": SourcePolicy(ROBLOX_DETAILS_MAX_AGE, 24 * 3600, 30 * 24 * 3600, 1),
+}
+
+
+def daily_refresh_cost() -> float:
+    """Upstream calls per account per day with every source refreshed at its starting TTL."""
+    return sum(policy.cost * 86400 / policy.ttl for policy in REFRESH_SOURCES.values())
+
+
+class RefreshScheduler:
+    """Refreshes each data source of each account on its own adaptive TTL.
+
+    A source whose last refresh found a change is checked again in half the
+    time; one that didn't, in 1.5 times the time, within its policy's
+    bounds. Volatile sources (counts) converge on short TTLs and static
+    ones (details) on long ones. Due refreshes run at most
+    ``concurrency`` at a time and only while the daily call budget lasts;
+    the rest wait for a later tick, most overdue first.
+
+    The budget is fixed at what the old full refresh spent. Every source
+    can keep its starting TTL within it; going below that is paid for by
+    sources that backed off, and once the budget runs short it, not the
+    TTLs, sets the pace, which is logged when it starts and stops.
+    """
+
+    def __init__(self, run, daily_budget: float, concurrency: int = REFRESH_CONCURRENCY):
+        # run(account, source) -> True if the data changed, False if not, None if it failed
+        self.run = run
+        self.budget = TokenBucket(daily_budget / 86400, daily_budget)
+        self.concurrency = concurrency
+        self.ttls: dict = {}  # (account ID, source) -> current TTL
+        self.due: dict = {}  # (account ID, source) -> monotonic time it's due
+        self.accounts: dict = {}
+        self.budget_bound = False
+        self._heap: list = []
+
+    @staticmethod
+    def sources(account: TrackedAccount) -> tuple:
+        sources = ("discord",) if account.discord_user_id else ()
+        if account.roblox_user_id:
+            sources += ("roblox", "roblox_counts", "roblox_details")
+        return sources
+
+    def _schedule(self, key: tuple, delay: float):
+        due = time.monotonic() + delay
+        self.due[key] = due
+        # Superseded entries stay in the heap and are skipped when popped
+        heapq.heappush(self._heap, (due, key))
+
+    def track(self, account: TrackedAccount, age: float):
+        """Start scheduling ``account``, whose data was fetched ``age`` seconds ago."""
+        self.accounts[account.account_id] = account
+        for source in self.sources(account):
+            key = (account.account_id, source)
+            ttl = self.ttls.setdefault(key, REFRESH_SOURCES[source].ttl)
+            self._schedule(key, max(0.0, ttl - age))
+
+    def refreshed(self, account: TrackedAccount):
+        """Every source of ``account`` was just refreshed outside the scheduler."""
+        for source in self.sources(account):
+            key = (account.account_id, source)
+            self._schedule(key, self.ttls.get(key, REFRESH_SOURCES[source].ttl))
+
+    def take_due(self) -> list:
+        """Pop the due refreshes the call budget allows.
+
+        A job too costly for the budget left stays queued, still due, while
+        cheaper ones behind it go ahead.
+        """
+        now = time.monotonic()
+        jobs = []
+        deferred = []
+        while self._heap and self._heap[0][0] <= now:
+            due, key = heapq.heappop(self._heap)
+            if self.due.get(key) != due:
+                continue
+            if not self.budget.try_take(REFRESH_SOURCES[key[1]].cost):
+                deferred.append((due, key))
+                continue
+            del self.due[key]
+            jobs.append(key)
+        for entry in deferred:
+            heapq.heappush(self._heap, entry)
+        if bool(deferred) != self.budget_bound:
+            self.budget_bound = bool(deferred)
+            if deferred:
+                log.info("Refresh call budget exhausted; %d due refresh(es) are waiting for it", len(deferred))
+            else:
+                log.info("Refresh call budget caught up with due refreshes")
+        return jobs
+
+    def _adapt(self, key: tuple, changed: Optional[bool]):
+        policy = REFRESH_SOURCES[key[1]]
+        ttl = self.ttls.get(key, policy.ttl)
+        if changed is None:
+            # Failed: try again soon without learning anything
+            self._schedule(key, policy.min_ttl)
+            return
+        ttl = ttl / 2 if changed else ttl * 1.5
+        self.ttls[key] = ttl = min(policy.max_ttl, max(policy.min_ttl, ttl))
+        self._schedule(key, ttl)
+
+    async def run_due(self):
+        jobs = self.take_due()
+        if not jobs:
+            return
+        log.debug("Refreshing %d due source(s)", len(jobs))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh(key: tuple):
+            account_id, source = key
+            async with semaphore:
+                try:
+                    changed = await self.run(self.accounts[account_id], source)
+                except Exception as e:
+                    log.error("Error refreshing %s of account %s: %r", source, account_id, e)
+                    changed = None
+            self._adapt(key, changed)
+
+        await asyncio.gather(*(refresh(key) for key in jobs))
+
+
+# ==================== DISCORD FIELDS ====================
+
+def discord_user_fields(user) -> dict:
+    """Profile fields taken from a discord.User or discord.Member.
+
+    Uses the global name and avatar even for members, so the result matches
+    what ``bot.fetch_user`` returns regardless of guild nicknames/avatars.
+    """
+    avatar = user.avatar or user.default_avatar
+    return {
+        "user_id": str(user.id),
+        "username": user.name,
+        "display_name": user.global_name or user.name,
+        # Animated if available
+        "avatar_url": str(avatar.url),
+        "avatar_hash": avatar.key,
+        "discriminator": user.discriminator,
+        "public_flags": user.public_flags.value if user.public_flags else 0,
     }
 
 
-@api_app.after_request
-def after_request(response):
-    """Add CORS headers to all responses."""
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,OPTIONS')
-    response.headers.add('Cache-Control', 'public, max-age=300')  # Cache for 5 minutes
-    return response
-
-
-@api_app.route('/api/profile', methods=['GET', 'OPTIONS'])
-def profile_endpoint():
-    """API endpoint to get full profile data."""
-    if request.method == 'OPTIONS':
-        return '', 204
-    
-    data = get_profile_data()
-    print(f"[API] Serving profile data - Last update: {data.get('last_update', 'never')}")
-    return jsonify(data)
-
-
-@api_app.route('/api/profile/discord', methods=['GET', 'OPTIONS'])
-def discord_endpoint():
-    """API endpoint to get Discord data only."""
-    if request.method == 'OPTIONS':
-        return '', 204
-    
-    data = get_profile_data()
-    return jsonify(data.get("discord", {}))
-
-
-@api_app.route('/api/profile/roblox', methods=['GET', 'OPTIONS'])
-def roblox_endpoint():
-    """API endpoint to get Roblox data only."""
-    if request.method == 'OPTIONS':
-        return '', 204
-    
-    data = get_profile_data()
-    return jsonify(data.get("roblox", {}))
-
-
-@api_app.route('/api/health', methods=['GET'])
-def health_check():
-    """Health check endpoint."""
-    return jsonify({
-        "status": "ok",
-        "timestamp": datetime.now().isoformat(),
-        "discord_user_id": DISCORD_USER_ID,
-        "roblox_user_id": ROBLOX_USER_ID
-    })
-
-
-@api_app.route('/', methods=['GET'])
-def root():
-    """Root endpoint with API info."""
-    return jsonify({
-        "name": "Profile API",
-        "version": "1.0.0",
-        "endpoints": {
-            "profile": "/api/profile",
-            "discord": "/api/profile/discord",
-            "roblox": "/api/profile/roblox",
-            "health": "/api/health"
-        }
-    })
+def discord_presence_fields(member) -> dict:
+    """Status fields taken from a discord.Member's presence."""
+    activity = member.activity
+    return {
+        "status": str(member.status),
+        "activity": str(activity) if activity else None,
+        "custom_status": activity.name if isinstance(activity, discord.CustomActivity) else None,
+    }
+
+
+# ==================== EMBEDS ====================
+# Built from a profile dict only, so commands can cache them per snapshot
+# generation (see ProfileCog.rendered).
+
+def profile_embed(data: dict) -> discord.Embed:
+    embed = discord.Embed(
+        title="📋 Profile Data",
+        description=f"**Last update:** {data['last_update']}\n\n**API Endpoint:**\n`http://209.74.83.91:{API_PORT}/api/profile`",
+        color=discord.Color.green()
+    )
+    
+    # Discord section
+    if data.get("discord"):
+        d = data["discord"]
+        embed.add_field(
+            name="🎮 Discord",
+            value=f"**{d.get('display_name', 'N/A')}**\n@{d.get('username', 'N/A')}\nStatus: {d.get('status', 'Unknown')}",
+            inline=True
+        )
+        if d.get("avatar_url"):
+            embed.set_thumbnail(url=d["avatar_url"])
+    
+    # Roblox section
+    if data.get("roblox"):
+        r = data["roblox"]
+        embed.add_field(
+            name="🎲 Roblox",
+            value=f"**{r.get('display_name', 'N/A')}**\n@{r.get('username', 'N/A')}\n👥 {r.get('friends_count', 0)} friends\n❤️ {r.get('followers_count', 0)} followers",
+            inline=True
+        )
+    
+    embed.set_footer(text=f"Auto-updates as the data changes | API on port {API_PORT}")
+    return embed
+
+
+def profile_json(data: dict) -> tuple:
+    """The profile as a message, or as (None, file bytes) if too long for one."""
+    json_str = json.dumps(data, indent=2, default=str)
+    if len(json_str) > 1900:
+        return None, json_str.encode()
+    return f"```json\n{json_str}\n```", None
+
+
+def avatar_embed(data: dict) -> discord.Embed:
+    embed = discord.Embed(title="🖼️ Avatar URLs", color=discord.Color.purple())
+    
+    if data.get("discord", {}).get("avatar_url"):
+        embed.add_field(
+            name="Discord Avatar",
+            value=f"```{data['discord']['avatar_url']}```",
+            inline=False
+        )
+        embed.set_thumbnail(url=data["discord"]["avatar_url"])
+    
+    if data.get("roblox", {}).get("avatar_url"):
+        embed.add_field(
+            name="Roblox Avatar",
+            value=f"```{data['roblox']['avatar_url']}```",
+            inline=False
+        )
+    
+    embed.set_footer(text="Use these URLs in your portfolio for current avatars")
+    return embed
 
 
-def run_flask():
-    """Run Flask server in a separate thread."""
-    print(f"[API] Starting Flask server on {API_HOST}:{API_PORT}")
-    api_app.run(host=API_HOST, port=API_PORT, debug=False, use_reloader=False, threaded=True)
+def apiinfo_embed(data: dict) -> discord.Embed:
+    embed = discord.Embed(
+        title="🌐 Profile API Information",
+        description="Your profile data is being served via HTTP API.",
+        color=discord.Color.blue()
+    )
+    
+    embed.add_field(
+        name="📍 Main Endpoint",
+        value=f"```http://209.74.83.91:{API_PORT}/api/profile```",
+        inline=False
+    )
+    embed.add_field(
+        name="🎮 Discord Only",
+        value=f"`/api/profile/discord`",
+        inline=True
+    )
+    embed.add_field(
+        name="🎲 Roblox Only",
+        value=f"`/api/profile/roblox`",
+        inline=True
+    )
+    embed.add_field(
+        name="💓 Health Check",
+        value=f"`/api/health`",
+        inline=True
+    )
+    
+    embed.add_field(
+        name="📖 Usage",
+        value="```javascript\nfetch('http://209.74.83.91:25566/api/profile')\n  .then(res => res.json())\n  .then(data => console.log(data));\n```",
+        inline=False
+    )
+    
+    embed.set_footer(text=f"Server running on port {API_PORT} | Data updates as it changes")
+    return embed
+
+
+def forceupdate_embed(data: dict) -> discord.Embed:
+    embed = discord.Embed(
+        title="✅ Force Update Complete",
+        description=f"Profile data has been refreshed.\n\n**Timestamp:** {data['last_update']}",
+        color=discord.Color.green()
+    )
+    
+    if data.get("discord", {}).get("avatar_url"):
+        embed.set_thumbnail(url=data["discord"]["avatar_url"])
+    return embed
+
+
+UPDATING_EMBED = discord.Embed(title="🔄 Updating Profile Data...", color=discord.Color.purple())
+FORCE_UPDATING_EMBED = discord.Embed(
+    title="⚡ Force Updating...",
+    description="Fetching latest data from Discord and Roblox APIs",
+    color=discord.Color.orange()
+)
 
 
 class ProfileCog(commands.Cog):
@@ -148,69 +965,151 @@ class ProfileCog(commands.Cog):
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.session: Optional[aiohttp.ClientSession] = None
-        self.profile_data = self.load_data()
+        if UPSTREAM_MODE == "live":
+            self.http = OutboundClient(UpstreamCache())
+        else:
+            # Recordings must hold full responses, so no conditional requests
+            self.http = OutboundClient(recordings=UpstreamRecordings(UPSTREAM_MODE))
+        self.roblox = RobloxClient(self._fetch_json)
+        self._roblox_details_at: dict = {}  # Roblox user ID -> monotonic time details were fetched
+        self.primary: TrackedAccount = profile_registry.accounts[DEFAULT_ACCOUNT_ID]
+        self._accounts_by_discord_id: dict = {}
+        for account in profile_registry.accounts.values():
+            if account.discord_user_id:
+                self._accounts_by_discord_id.setdefault(account.discord_user_id, []).append(account)
+        self._presence_guilds: dict = {}  # Discord user ID -> guild we last saw them in
+        self.writer = ProfileWriter()
+        self._refreshes: dict = {}  # Account ID -> in-flight refresh task
+        self._refresh_patches: dict = {}  # Account ID -> Discord fields patched while its refresh was fetching
+        self._rendered: dict = {}  # Render function -> (snapshot generation, result)
+        self._cooldown_notices = commands.CooldownMapping.from_cooldown(1, COMMAND_COOLDOWN, commands.BucketType.user)
+        # Read DATA_FILE now, so the API serves it while the bot is still starting
+        profile_snapshot.get()
+        
+        if daily_refresh_cost() > REFRESH_CALL_BUDGET:
+            log.warning("REFRESH_SOURCES start above REFRESH_CALL_BUDGET (%.1f > %.1f calls a day); "
+                        "the budget will hold refreshes back", daily_refresh_cost(), REFRESH_CALL_BUDGET)
+        self.scheduler = RefreshScheduler(self.refresh_source, REFRESH_CALL_BUDGET * len(profile_registry.accounts))
+        for account in profile_registry.accounts.values():
+            # Accounts never saved are due right away
+            saved = _file_mtime(account.data_file) is not None
+            self.scheduler.track(account, self.data_age(self.current_data(account)) if saved else float("inf"))
         
-        # Start Flask API server in a separate thread
-        self.api_thread = threading.Thread(target=run_flask, daemon=True)
-        self.api_thread.start()
-        print(f"[ProfileCog] API server started at http://{API_HOST}:{API_PORT}/api/profile")
+        # Server modules are only imported for the server in use
+        self.api_server = None
+        self.api_workers = None
+        self.shared_snapshot: Optional[SharedSnapshotWriter] = None
+        if API_SERVER == "aiohttp":
+            from profile_api_aiohttp import AsyncApiServer
+            # Started in cog_load, once we're running on the bot's loop
+            self.api_server = AsyncApiServer()
+        elif API_SERVER == "workers":
+            from profile_api_aiohttp import ApiWorkerPool
+            # Workers need something to map before they take their first request
+            self.shared_snapshot = SharedSnapshotWriter()
+            self.shared_snapshot.publish()
+            self.api_workers = ApiWorkerPool()
+            self.api_workers.start()
+        elif API_SERVER != "none":
+            from profile_api_flask import run_flask
+            # Start Flask API server in a separate thread
+            self.api_thread = threading.Thread(target=run_flask, daemon=True)
+            self.api_thread.start()
+            log.info("API server started at http://%s:%s/api/profile", API_HOST, API_PORT)
         
         # Start auto-update task
         self.auto_update.start()
     
-    def cog_unload(self):
+    async def cog_load(self):
+        image_cache.attach(asyncio.get_running_loop(), self.http)
+        self._lag_monitor = asyncio.ensure_future(self.monitor_loop_lag())
+        if self.api_server:
+            await self.api_server.start()
+            log.info("API server started at http://%s:%s/api/profile", API_HOST, API_PORT)
+    
+    async def cog_unload(self):
         self.auto_update.cancel()
-        if self.session:
-            asyncio.create_task(self.session.close())
+        self._lag_monitor.cancel()
+        await self.writer.flush()
+        history_store.close()
+        if self.api_server:
+            await self.api_server.stop()
+        if self.api_workers:
+            await asyncio.get_running_loop().run_in_executor(None, self.api_workers.stop)
+            self.shared_snapshot.close()
+        image_cache.detach()
+        await self.http.close()
     
-    def load_data(self) -> dict:
-        """Load profile data from JSON file."""
-        if os.path.exists(DATA_FILE):
-            try:
-                with open(DATA_FILE, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"[ProfileCog] Error loading data: {e}")
-        return {
-            "last_update": None,
-            "discord": {},
-            "roblox": {}
-        }
+    async def monitor_loop_lag(self):
+        """Sample how late the loop wakes us; long callbacks on it show up here."""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            LOOP_LAG.observe(max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
     
-    def save_data(self):
-        """Save profile data to JSON file."""
-        try:
-            with open(DATA_FILE, 'w') as f:
-                json.dump(self.profile_data, f, indent=2, default=str)
-            print(f"[ProfileCog] Data saved to {DATA_FILE}")
-        except Exception as e:
-            print(f"[ProfileCog] Error saving data: {e}")
+    @property
+    def profile_data(self) -> dict:
+        """The primary account's data; see current_data."""
+        return profile_snapshot.get()
+    
+    def current_data(self, account: TrackedAccount) -> dict:
+        """Return the latest data we hold for ``account``.
+        
+        Every account, the primary one included, lives solely in its
+        snapshot, so an external edit of its data file that the API reloads
+        is what the cog patches and renders too.
+        """
+        return profile_registry.snapshots[account.account_id].get()
+    
+    def record_history(self, account: TrackedAccount, data: dict, metrics=HISTORY_METRICS):
+        """Append ``metrics`` from ``data`` to the history store, off the event loop."""
+        samples = history_samples(data, metrics)
+        if samples:
+            asyncio.get_running_loop().run_in_executor(
+                None, history_store.append, account.account_id, samples, time.time()
+            )
+    
+    def prefetch_images(self, data: dict):
+        """Start caching any avatar/banner URL in ``data`` we haven't downloaded yet."""
+        if image_cache.http is None:
+            return
+        discord_data = data.get("discord") or {}
+        for url in (
+            discord_data.get("avatar_url"),
+            discord_data.get("banner_url"),
+            (data.get("roblox") or {}).get("avatar_url"),
+        ):
+            if url and image_cache.lookup(image_cache.key(url)) is None:
+                asyncio.ensure_future(image_cache.fetch(url))
+    
+    def save_data(self, account: Optional[TrackedAccount] = None, data: Optional[dict] = None):
+        """Publish profile data to the API and queue it to be saved to disk."""
+        account = account or self.primary
+        data = data if data is not None else self.profile_data
+        snapshot = profile_registry.snapshots[account.account_id]
+        snapshot.publish(data)
+        if self.shared_snapshot:
+            self.shared_snapshot.schedule()
+        self.writer.submit(snapshot, data)
     
     async def get_session(self) -> aiohttp.ClientSession:
         """Get or create aiohttp session."""
-        if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
-        return self.session
+        return await self.http.get_session()
     
-    async def fetch_discord_data(self) -> dict:
-        """Fetch Discord user data."""
+    async def fetch_discord_data(self, account: Optional[TrackedAccount] = None) -> Optional[dict]:
+        """Fetch Discord user data; None if the fetch failed (see discord_fallback)."""
+        account = account or self.primary
+        if not account.discord_user_id:
+            return {}
+        
         try:
-            user = await self.bot.fetch_user(DISCORD_USER_ID)
-            
-            # Get avatar URL (animated if available)
-            avatar_url = str(user.display_avatar.url)
+            user = await asyncio.wait_for(self.fetch_discord_user(account.discord_user_id), FETCH_TIMEOUT)
             
             data = {
-                "user_id": str(user.id),
-                "username": user.name,
-                "display_name": user.display_name or user.name,
-                "avatar_url": avatar_url,
-                "avatar_hash": user.display_avatar.key if user.display_avatar else None,
-                "discriminator": user.discriminator,
+                **discord_user_fields(user),
                 "is_bot": user.bot,
                 "created_at": str(user.created_at),
-                "public_flags": user.public_flags.value if user.public_flags else 0,
                 "banner_url": str(user.banner.url) if user.banner else None,
                 "accent_color": str(user.accent_color) if user.accent_color else None,
                 "status": "online",
@@ -218,326 +1117,440 @@ class ProfileCog(commands.Cog):
             }
             
             # Try to get presence/status if in a shared guild
-            for guild in self.bot.guilds:
-                member = guild.get_member(DISCORD_USER_ID)
-                if member:
-                    data["status"] = str(member.status)
-                    data["activity"] = str(member.activity) if member.activity else None
-                    if member.activity and isinstance(member.activity, discord.CustomActivity):
-                        data["custom_status"] = member.activity.name
-                    break
+            member = self.find_member(account.discord_user_id)
+            if member:
+                data.update(discord_presence_fields(member))
             
-            print(f"[ProfileCog] Discord data fetched: {data['display_name']} (@{data['username']})")
-            return data
         except Exception as e:
-            print(f"[ProfileCog] Error fetching Discord data: {e}")
-            return {
-                "user_id": str(DISCORD_USER_ID),
-                "username": "Realice",
-                "display_name": "David",
-                "status": "online",
-                "custom_status": "Life to no Limits"
-            }
+            log.error("Error fetching Discord data: %r", e)
+            return None
+        
+        # Outside the try: a mistyped field is a bug here, not a failed fetch
+        log.info("Discord data fetched: %s (@%s)", data["display_name"], data["username"])
+        return DiscordProfile.validate(data)
     
-    async def fetch_roblox_data(self) -> dict:
-        """Fetch Roblox user data using Roblox API with OpenCloud thumbnail."""
-        session = await self.get_session()
+    async def fetch_discord_user(self, user_id: int) -> discord.User:
+        """``bot.fetch_user``, recorded or replayed like the other upstreams (see UPSTREAM_MODE)."""
+        recordings = self.http.recordings
+        if recordings is None:
+            return await self.bot.fetch_user(user_id)
+        url = f"https://discord.com/api/v10/users/{user_id}"
+        if recordings.replaying:
+            payload = await recordings.replay_json(url)
+            if payload is None:
+                raise LookupError(f"No recording of Discord user {user_id}")
+        else:
+            # The raw payload fetch_user builds its User from, so it can be saved
+            payload = await self.bot.http.get_user(user_id)
+            await recordings.record_json(url, payload)
+        return discord.User(state=self.bot._connection, data=payload)
+    
+    def discord_fallback(self, account: TrackedAccount) -> dict:
+        """The Discord section to publish when a fetch failed: whatever we fetched last time."""
+        previous = self.current_data(account).get("discord", {})
+        return {**default_profile(account).discord.to_dict(), **previous}
+    
+    def find_member(self, discord_user_id: int) -> Optional[discord.Member]:
+        """Find the user in a shared guild, trying the last known guild first."""
+        guild = self.bot.get_guild(self._presence_guilds.get(discord_user_id, 0))
+        member = guild.get_member(discord_user_id) if guild else None
+        if member:
+            return member
         
-        try:
-            # Fetch basic user info
-            async with session.get(
-                f"https://users.roblox.com/v1/users/{ROBLOX_USER_ID}"
-            ) as resp:
-                if resp.status == 200:
-                    user_data = await resp.json()
-                    print(f"[ProfileCog] Roblox user data: {user_data}")
-                else:
-                    print(f"[ProfileCog] Failed to fetch Roblox user: {resp.status}")
-                    return self._default_roblox_data()
-            
-            # Fetch avatar using Roblox Thumbnails API (420x420 for best quality)
-            async with session.get(
-                f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={ROBLOX_USER_ID}&size=420x420&format=Png&isCircular=false"
-            ) as resp:
-                avatar_url = None
-                if resp.status == 200:
-                    avatar_data = await resp.json()
-                    avatar_url = avatar_data.get("data", [{}])[0].get("imageUrl", "")
-                    print(f"[ProfileCog] Roblox avatar URL: {avatar_url}")
-            
-            # Fetch friend count
-            async with session.get(
-                f"https://friends.roblox.com/v1/users/{ROBLOX_USER_ID}/friends/count"
-            ) as resp:
-                friends_count = 0
-                if resp.status == 200:
-                    friends_data = await resp.json()
-                    friends_count = friends_data.get("count", 0)
-            
-            # Fetch follower count
-            async with session.get(
-                f"https://friends.roblox.com/v1/users/{ROBLOX_USER_ID}/followers/count"
-            ) as resp:
-                followers_count = 0
-                if resp.status == 200:
-                    followers_data = await resp.json()
-                    followers_count = followers_data.get("count", 0)
-            
-            # Fetch following count
-            async with session.get(
-                f"https://friends.roblox.com/v1/users/{ROBLOX_USER_ID}/followings/count"
-            ) as resp:
-                following_count = 0
-                if resp.status == 200:
-                    following_data = await resp.json()
-                    following_count = following_data.get("count", 0)
+        for guild in self.bot.guilds:
+            member = guild.get_member(discord_user_id)
+            if member:
+                self._presence_guilds[discord_user_id] = guild.id
+                return member
+        return None
+    
+    async def _fetch_json(self, url: str, method: str = "GET", payload: Optional[dict] = None) -> Optional[dict]:
+        """Request ``url`` and return its JSON body, or None on any failure."""
+        return await self.http.request_json(url, method, payload)
+    
+    async def fetch_roblox_data(self, account: Optional[TrackedAccount] = None) -> dict:
+        """Fetch Roblox user data using Roblox API with OpenCloud thumbnail.
+        
+        All Roblox requests go out concurrently through ``self.roblox``,
+        which batches them with lookups for other accounts. A field whose
+        request fails keeps its last known value, falling back to the
+        defaults.
+        """
+        account = account or self.primary
+        roblox_id = account.roblox_user_id
+        if not roblox_id:
+            return {}
+        
+        result = {**default_profile(account).roblox.to_dict(), **self.current_data(account).get("roblox", {})}
+        
+        # The full user document is only needed now and then; otherwise the
+        # batched lookup is enough to keep names current
+        details_at = self._roblox_details_at.get(roblox_id)
+        need_details = (
+            "created_at" not in result
+            or details_at is None
+            or time.monotonic() - details_at > ROBLOX_DETAILS_MAX_AGE
+        )
+        lookups = [
+            self.fetch_roblox_profile(account, names=not need_details),
+            self.fetch_roblox_counts(account),
+        ]
+        if need_details:
+            lookups.append(self.fetch_roblox_details(account))
+        
+        results = await asyncio.gather(*lookups)
+        for fields in results:
+            result.update(fields or {})
+        counts = results[1]
+        if counts:
+            # Only counts that were actually fetched; result also holds stale or default ones
+            self.record_history(account, {"roblox": counts}, tuple(counts))
+        
+        result["user_id"] = roblox_id
+        log.info("Roblox data fetched: %s (@%s)", result.get("display_name"), result.get("username"))
+        return RobloxProfile.validate(result)
+    
+    async def fetch_roblox_profile(self, account: TrackedAccount, names: bool = True) -> Optional[dict]:
+        """Fetch the avatar and, unless ``names`` is False, the names; None if every lookup failed."""
+        roblox_id = account.roblox_user_id
+        user_data, avatar_url = await asyncio.gather(
+            self.roblox.get_user(roblox_id) if names else asyncio.sleep(0),
+            self.roblox.get_headshot_url(roblox_id),
+        )
+        fields = {}
+        if user_data:
+            fields["username"] = user_data.get("name", "")
+            fields["display_name"] = user_data.get("displayName", "")
+        if avatar_url:
+            fields["avatar_url"] = avatar_url
+        return fields or None
+    
+    async def fetch_roblox_counts(self, account: TrackedAccount) -> Optional[dict]:
+        """Fetch friend/follower/following counts, leaving out any that failed."""
+        roblox_id = account.roblox_user_id
+        counts = await asyncio.gather(
+            self.roblox.get_count(roblox_id, "friends"),
+            self.roblox.get_count(roblox_id, "followers"),
+            self.roblox.get_count(roblox_id, "followings"),
+        )
+        fields = {
+            field: count
+            for field, count in zip(("friends_count", "followers_count", "following_count"), counts)
+            if count is not None
+        }
+        return fields or None
+    
+    async def fetch_roblox_details(self, account: TrackedAccount) -> Optional[dict]:
+        """Fetch the full user document: names plus description, created and is_banned."""
+        roblox_id = account.roblox_user_id
+        user_data = await self.roblox.get_user_details(roblox_id)
+        if not user_data:
+            return None
+        self._roblox_details_at[roblox_id] = time.monotonic()
+        return {
+            "username": user_data.get("name", ""),
+            "display_name": user_data.get("displayName", ""),
+            "description": user_data.get("description", ""),
+            "is_banned": user_data.get("isBanned", False),
+            "created_at": user_data.get("created", ""),
+        }
+    
+    # ==================== GATEWAY EVENTS ====================
+    
+    def patch_discord(self, discord_user_id: int, fields: dict):
+        """Apply changed Discord fields to every account tracking this user.
+        
+        The snapshot is replaced with a patched copy (published dicts are
+        never mutated) and served immediately; save_data debounces the write.
+        """
+        for account in self._accounts_by_discord_id.get(discord_user_id, ()):
+            data = self.current_data(account)
+            current = data.get("discord") or {}
+            changed = {key: value for key, value in fields.items() if current.get(key) != value}
+            if not changed:
+                continue
             
-            result = {
-                "user_id": ROBLOX_USER_ID,
-                "username": user_data.get("name", ""),
-                "display_name": user_data.get("displayName", ""),
-                "description": user_data.get("description", ""),
-                "is_banned": user_data.get("isBanned", False),
-                "created_at": user_data.get("created", ""),
-                "avatar_url": avatar_url,
-                "friends_count": friends_count,
-                "followers_count": followers_count,
-                "following_count": following_count,
+            patched = {
+                **data,
+                "last_event": datetime.now().isoformat(),
+                "discord": {**current, **changed},
             }
-            
-            print(f"[ProfileCog] Roblox data fetched: {result['display_name']} (@{result['username']})")
-            return result
-            
+            self.save_data(account, patched)
+            self.prefetch_images(patched)
+            pending = self._refresh_patches.get(account.account_id)
+            if pending is not None:
+                pending.update(changed)
+            if "status" in changed:
+                self.record_history(account, patched, ("status",))
+    
+    @commands.Cog.listener()
+    async def on_presence_update(self, before: discord.Member, after: discord.Member):
+        if after.id in self._accounts_by_discord_id:
+            self._presence_guilds[after.id] = after.guild.id
+            self.patch_discord(after.id, discord_presence_fields(after))
+    
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        if after.id in self._accounts_by_discord_id:
+            self.patch_discord(after.id, discord_user_fields(after))
+    
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if after.id in self._accounts_by_discord_id:
+            self.patch_discord(after.id, discord_user_fields(after))
+    
+    # ==================== REFRESH ====================
+    
+    async def update_account(self, account: TrackedAccount) -> dict:
+        """Refresh ``account``, joining the refresh already running for it if there is one.
+        
+        Commands, the auto-update loop and background revalidations can
+        overlap; they all await the same task, so the APIs are queried and
+        the file written once per refresh.
+        """
+        task = self._refreshes.get(account.account_id)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh_account(account))
+            self._refreshes[account.account_id] = task
+            task.add_done_callback(
+                lambda done, account_id=account.account_id: self._refresh_done(account_id, done)
+            )
+        # Shielded so a cancelled caller doesn't abort the refresh for everyone else
+        return await asyncio.shield(task)
+    
+    def _refresh_done(self, account_id: str, task: asyncio.Task):
+        if self._refreshes.get(account_id) is task:
+            del self._refreshes[account_id]
+    
+    def revalidate(self, account: TrackedAccount) -> dict:
+        """Return the data held for ``account``, refreshing it in the background if it's stale."""
+        data = self.current_data(account)
+        if self.data_age(data) > PROFILE_FRESHNESS:
+            asyncio.ensure_future(self._revalidate(account))
+        return data
+    
+    async def _revalidate(self, account: TrackedAccount):
+        try:
+            await self.update_account(account)
         except Exception as e:
-            print(f"[ProfileCog] Error fetching Roblox data: {e}")
-            return self._default_roblox_data()
+            log.error("Error revalidating account %s: %r", account.account_id, e)
     
-    def _default_roblox_data(self) -> dict:
-        """Return default Roblox data."""
-        return {
-            "user_id": ROBLOX_USER_ID,
-            "username": "Realice",
-            "display_name": "David",
-            "avatar_url": f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={ROBLOX_USER_ID}&size=420x420&format=Png",
-            "friends_count": 0,
-            "followers_count": 0,
-            "following_count": 0
-        }
+    async def _refresh_account(self, account: TrackedAccount) -> dict:
+        """Fetch, save and publish the profile of one tracked account.
+        
+        Gateway events patched in while the fetches ran are newer than
+        what they returned, so they're applied on top rather than lost.
+        """
+        patches = self._refresh_patches[account.account_id] = {}
+        try:
+            discord_data, roblox_data = await asyncio.gather(
+                self.fetch_discord_data(account),
+                self.fetch_roblox_data(account),
+            )
+        finally:
+            del self._refresh_patches[account.account_id]
+        fetched_discord = discord_data is not None
+        if not fetched_discord:
+            # Keep the last known fields rather than blanking the profile
+            discord_data = self.discord_fallback(account)
+        
+        # Same key order as ProfileData.FIELDS; the fetchers validated their sections
+        data = {"last_update": datetime.now().isoformat()}
+        if patches:
+            data["last_event"] = self.current_data(account).get("last_event")
+        data["discord"] = DiscordProfile.validate({**discord_data, **patches})
+        data["roblox"] = roblox_data
+        
+        self.save_data(account, data)
+        self.prefetch_images(data)
+        if fetched_discord:
+            # A fallback status isn't a sample; fetch_roblox_data records the counts it fetched
+            self.record_history(account, data, ("status",))
+        self.scheduler.refreshed(account)
+        return data
     
-    async def update_all_data(self) -> dict:
-        """Update all profile data from Discord and Roblox."""
-        print(f"[ProfileCog] ========== Updating profile data at {datetime.now()} ==========")
+    async def refresh_source(self, account: TrackedAccount, source: str) -> Optional[bool]:
+        """Refresh one data source of ``account`` (see REFRESH_SOURCES) for the scheduler.
         
-        discord_data = await self.fetch_discord_data()
-        roblox_data = await self.fetch_roblox_data()
+        Returns whether anything changed, or None if the fetch failed.
+        Unchanged data isn't republished, so the snapshot's validators, and
+        every client cache built on them, stay valid.
+        """
+        if source == "discord":
+            fields = await self.fetch_discord_data(account)
+        elif source == "roblox":
+            fields = await self.fetch_roblox_profile(account)
+        elif source == "roblox_counts":
+            fields = await self.fetch_roblox_counts(account)
+        else:
+            fields = await self.fetch_roblox_details(account)
+        if not fields:
+            return None
+        
+        if source == "roblox_counts":
+            # History keeps every check, not only the changes
+            self.record_history(account, {"roblox": fields}, tuple(fields))
+        section = "discord" if source == "discord" else "roblox"
+        data = self.current_data(account)
+        current = data.get(section) or {}
+        if all(key in current and current[key] == value for key, value in fields.items()):
+            return False
         
-        self.profile_data = {
+        patched = {
+            **data,
             "last_update": datetime.now().isoformat(),
-            "discord": discord_data,
-            "roblox": roblox_data,
+            # Every fetched key, so ones that are None still appear
+            section: {**current, **fields},
         }
+        self.save_data(account, patched)
+        self.prefetch_images(patched)
+        return True
+    
+    async def update_all_data(self) -> dict:
+        """Update all profile data from Discord and Roblox."""
+        log.info("Updating profile data")
         
-        self.save_data()
-        print(f"[ProfileCog] ========== Profile data updated successfully ==========")
-        print(f"[ProfileCog] API endpoint: http://209.74.83.91:{API_PORT}/api/profile")
+        await self.update_account(self.primary)
+        
+        log.info("Profile data updated, served at http://209.74.83.91:%s/api/profile", API_PORT)
         
         return self.profile_data
     
-    def needs_update(self) -> bool:
-        """Check if data needs updating (older than 2 days)."""
-        if not self.profile_data.get("last_update"):
-            return True
+    async def update_accounts(self):
+        """Refresh every tracked account, at most REFRESH_CONCURRENCY at a time."""
+        accounts = list(profile_registry.accounts.values())
+        log.info("Refreshing %d account(s)", len(accounts))
+        semaphore = asyncio.Semaphore(REFRESH_CONCURRENCY)
+        
+        async def refresh(account: TrackedAccount):
+            async with semaphore:
+                try:
+                    await self.update_account(account)
+                except Exception as e:
+                    log.error("Error refreshing account %s: %r", account.account_id, e)
         
+        await asyncio.gather(*(refresh(account) for account in accounts))
+    
+    def data_age(self, data: dict) -> float:
+        """Seconds since ``data`` was fetched; infinite if it never was."""
         try:
-            last_update = datetime.fromisoformat(self.profile_data["last_update"])
-            return datetime.now() - last_update > timedelta(days=UPDATE_INTERVAL_DAYS)
-        except:
-            return True
+            last_update = datetime.fromisoformat(data["last_update"])
+        except (KeyError, TypeError, ValueError):
+            return float("inf")
+        return (datetime.now() - last_update).total_seconds()
     
-    @tasks.loop(hours=12)  # Check every 12 hours
+    @tasks.loop(seconds=SCHEDULER_TICK)
     async def auto_update(self):
-        """Automatically update data if older than 2 days."""
-        await self.bot.wait_until_ready()
-        
-        if self.needs_update():
-            await self.update_all_data()
+        """Refresh whichever data sources are due, see RefreshScheduler."""
+        await self.scheduler.run_due()
     
     @auto_update.before_loop
     async def before_auto_update(self):
+        # The API already serves the saved snapshot; sources that went stale
+        # while we were down are due now, so the first iteration refreshes them
         await self.bot.wait_until_ready()
-        # Do initial update on startup
-        print("[ProfileCog] Running initial data update...")
-        await self.update_all_data()
     
     # ==================== COMMANDS ====================
     
+    def rendered(self, render):
+        """Return ``render(profile_data)``, cached per snapshot generation.
+        
+        Repeated commands reuse the same embeds and payloads until the
+        profile changes, so spamming one costs a dict lookup.
+        """
+        # The generation before get(): a reload in get() then only costs one extra render
+        generation = profile_snapshot.generation
+        data = profile_snapshot.get()
+        cached = self._rendered.get(render)
+        if cached is None or cached[0] != generation:
+            cached = self._rendered[render] = (generation, render(data))
+        return cached[1]
+    
+    async def cog_command_error(self, ctx: commands.Context, error: commands.CommandError):
+        if isinstance(error, commands.CommandOnCooldown):
+            # Tell a spammer once per cooldown rather than answering every message
+            if ctx.interaction or not self._cooldown_notices.update_rate_limit(ctx.message):
+                await ctx.send(f"⏳ Slow down, try again in {error.retry_after:.0f}s.", ephemeral=True)
+            return
+        # Handling the error here replaces discord.py's default handler, so keep its traceback
+        log.error("Command %s failed: %r", ctx.command, error, exc_info=error)
+    
     @commands.hybrid_command(name="profile", description="Update and display profile data")
+    @commands.cooldown(1, COMMAND_COOLDOWN, commands.BucketType.user)
     async def profile(self, ctx: commands.Context):
-        """Manually trigger a profile data update."""
+        """Display profile data, updating it first if it's older than PROFILE_FRESHNESS."""
         await ctx.defer()
         
-        embed = discord.Embed(
-            title="🔄 Updating Profile Data...",
-            color=discord.Color.purple()
-        )
-        msg = await ctx.send(embed=embed)
-        
-        data = await self.update_all_data()
-        
-        # Build response embed
-        embed = discord.Embed(
-            title="✅ Profile Data Updated",
-            description=f"**Last update:** {data['last_update']}\n\n**API Endpoint:**\n`http://209.74.83.91:{API_PORT}/api/profile`",
-            color=discord.Color.green()
-        )
-        
-        # Discord section
-        if data.get("discord"):
-            d = data["discord"]
-            embed.add_field(
-                name="🎮 Discord",
-                value=f"**{d.get('display_name', 'N/A')}**\n@{d.get('username', 'N/A')}\nStatus: {d.get('status', 'Unknown')}",
-                inline=True
-            )
-            if d.get("avatar_url"):
-                embed.set_thumbnail(url=d["avatar_url"])
-        
-        # Roblox section
-        if data.get("roblox"):
-            r = data["roblox"]
-            embed.add_field(
-                name="🎲 Roblox",
-                value=f"**{r.get('display_name', 'N/A')}**\n@{r.get('username', 'N/A')}\n👥 {r.get('friends_count', 0)} friends\n❤️ {r.get('followers_count', 0)} followers",
-                inline=True
-            )
-        
-        embed.set_footer(text=f"Auto-updates every {UPDATE_INTERVAL_DAYS} days | API on port {API_PORT}")
+        msg = None
+        data = self.current_data(self.primary)
+        if self.data_age(data) > PROFILE_FRESHNESS:
+            msg = await ctx.send(embed=UPDATING_EMBED)
+            await self.update_all_data()
         
-        await msg.edit(embed=embed)
+        embed = self.rendered(profile_embed)
+        if msg:
+            await msg.edit(embed=embed)
+        else:
+            await ctx.send(embed=embed)
     
     @commands.hybrid_command(name="profiledata", description="Get raw profile data as JSON")
+    @commands.cooldown(1, COMMAND_COOLDOWN, commands.BucketType.user)
     async def profiledata(self, ctx: commands.Context):
         """Get the raw JSON profile data."""
-        data = self.load_data()
-        
-        # Format as code block
-        json_str = json.dumps(data, indent=2, default=str)
-        
-        if len(json_str) > 1900:
-            # Send as file if too long
-            with open("temp_profile.json", "w") as f:
-                f.write(json_str)
-            await ctx.send("📄 Profile data:", file=discord.File("temp_profile.json"))
-            os.remove("temp_profile.json")
+        message, payload = self.rendered(profile_json)
+        if payload is not None:
+            # Send as file if too long; each send gets its own buffer over the cached bytes
+            await ctx.send("📄 Profile data:", file=discord.File(io.BytesIO(payload), filename="profile.json"))
         else:
-            await ctx.send(f"```json\n{json_str}\n```")
+            await ctx.send(message)
     
     @commands.hybrid_command(name="avatar", description="Get current avatar URLs")
+    @commands.cooldown(1, COMMAND_COOLDOWN, commands.BucketType.user)
     async def avatar(self, ctx: commands.Context):
         """Get current avatar URLs for use in portfolio."""
-        data = await self.update_all_data()
-        
-        embed = discord.Embed(title="🖼️ Avatar URLs", color=discord.Color.purple())
-        
-        if data.get("discord", {}).get("avatar_url"):
-            embed.add_field(
-                name="Discord Avatar",
-                value=f"```{data['discord']['avatar_url']}```",
-                inline=False
-            )
-            embed.set_thumbnail(url=data["discord"]["avatar_url"])
-        
-        if data.get("roblox", {}).get("avatar_url"):
-            embed.add_field(
-                name="Roblox Avatar",
-                value=f"```{data['roblox']['avatar_url']}```",
-                inline=False
-            )
+        # Answer from what we have; a stale profile is refreshed in the background
+        data = self.revalidate(self.primary)
+        if not data.get("last_update"):
+            await self.update_all_data()
         
-        embed.set_footer(text="Use these URLs in your portfolio for current avatars")
-        await ctx.send(embed=embed)
+        await ctx.send(embed=self.rendered(avatar_embed))
     
     @commands.hybrid_command(name="apiinfo", description="Get API endpoint information")
+    @commands.cooldown(1, COMMAND_COOLDOWN, commands.BucketType.user)
     async def apiinfo(self, ctx: commands.Context):
         """Display API endpoint information."""
-        embed = discord.Embed(
-            title="🌐 Profile API Information",
-            description="Your profile data is being served via HTTP API.",
-            color=discord.Color.blue()
-        )
-        
-        embed.add_field(
-            name="📍 Main Endpoint",
-            value=f"```http://209.74.83.91:{API_PORT}/api/profile```",
-            inline=False
-        )
-        embed.add_field(
-            name="🎮 Discord Only",
-            value=f"`/api/profile/discord`",
-            inline=True
-        )
-        embed.add_field(
-            name="🎲 Roblox Only",
-            value=f"`/api/profile/roblox`",
-            inline=True
-        )
-        embed.add_field(
-            name="💓 Health Check",
-            value=f"`/api/health`",
-            inline=True
-        )
-        
-        embed.add_field(
-            name="📖 Usage",
-            value="```javascript\nfetch('http://209.74.83.91:25566/api/profile')\n  .then(res => res.json())\n  .then(data => console.log(data));\n```",
-            inline=False
-        )
-        
-        embed.set_footer(text=f"Server running on port {API_PORT} | Data updates every {UPDATE_INTERVAL_DAYS} days")
-        await ctx.send(embed=embed)
+        await ctx.send(embed=self.rendered(apiinfo_embed))
     
     @commands.hybrid_command(name="forceupdate", description="Force update profile data immediately")
+    @commands.cooldown(1, FORCEUPDATE_COOLDOWN, commands.BucketType.user)
     async def forceupdate(self, ctx: commands.Context):
         """Force an immediate update of profile data."""
         await ctx.defer()
         
-        embed = discord.Embed(
-            title="⚡ Force Updating...",
-            description="Fetching latest data from Discord and Roblox APIs",
-            color=discord.Color.orange()
-        )
-        msg = await ctx.send(embed=embed)
-        
-        data = await self.update_all_data()
-        
-        embed = discord.Embed(
-            title="✅ Force Update Complete",
-            description=f"Profile data has been refreshed.\n\n**Timestamp:** {data['last_update']}",
-            color=discord.Color.green()
-        )
-        
-        if data.get("discord", {}).get("avatar_url"):
-            embed.set_thumbnail(url=data["discord"]["avatar_url"])
-        
-        await msg.edit(embed=embed)
-
+        msg = await ctx.send(embed=FORCE_UPDATING_EMBED)
+        await self.update_all_data()
+        await msg.edit(embed=self.rendered(forceupdate_embed))
 
 async def setup(bot: commands.Bot):
     """Setup function for loading the cog."""
     await bot.add_cog(ProfileCog(bot))
-    print("[ProfileCog] Cog loaded successfully")
+    log.info("Cog loaded successfully")
 
 
 # ==================== STANDALONE USAGE ====================
-# Run this file directly to start the bot
+# Run this file directly to start the bot (and the API, see API_SERVER).
+# --bot-only skips the API, e.g. when profile_api.py serves it separately.
 
 if __name__ == "__main__":
-    from dotenv import load_dotenv
+    import sys
     
-    load_dotenv()
+    # profile_api already loaded .env, before any setting was read
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    if "--bot-only" in sys.argv[1:]:
+        API_SERVER = "none"
     
     print("=" * 50)
-    print("Profile Bot + API Server")
+    print("Profile Bot" if API_SERVER == "none" else "Profile Bot + API Server")
     print("=" * 50)
     print(f"Discord User ID: {DISCORD_USER_ID}")
     print(f"Roblox User ID: {ROBLOX_USER_ID}")
@@ -551,13 +1564,18 @@ if __name__ == "__main__":
     
     bot = commands.Bot(command_prefix="!", intents=intents)
     
+    async def setup_hook():
+        # Runs once, right after login and before the gateway connects, so
+        # the API serves the saved snapshot while the bot is still starting
+        await bot.add_cog(ProfileCog(bot))
+    
+    bot.setup_hook = setup_hook
+    
     @bot.event
     async def on_ready():
         print(f"\n✅ Logged in as {bot.user}")
         print(f"📊 Connected to {len(bot.guilds)} guilds")
         
-        await bot.add_cog(ProfileCog(bot))
-        
         try:
             synced = await bot.tree.sync()
             print(f"🔄 Synced {len(synced)} slash commands")
@@ -575,7 +1593,8 @@ if __name__ == "__main__":
     # Get token from environment variable
     token = os.getenv("DISCORD_BOT_TOKEN")
     if token:
-        bot.run(token)
+        # Logging is configured above; discord.py's records go through the root logger too
+        bot.run(token, log_handler=None)
     else:
         print("\n❌ Error: DISCORD_BOT_TOKEN not found in environment variables")
-        print("Create a .env file with: DISCORD_BOT_TOKEN=your_token_here")
+        print("Create a .env file (read with python-dotenv) with: DISCORD_BOT_TOKEN=your_token_here")
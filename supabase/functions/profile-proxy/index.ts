@@ -6,6 +6,8 @@ const corsHeaders = {
 };
 
 const BOT_API_URL = "http://209.74.83.91:25566/api/profile";
+// Same value as the bot's PROFILE_API_PROXY_SECRET; exempts this proxy from its per-IP rate limit
+const PROXY_SECRET = Deno.env.get("PROFILE_API_PROXY_SECRET");
 
 serve(async (req) => {
   // Handle CORS preflight requests
@@ -20,6 +22,7 @@ serve(async (req) => {
       method: 'GET',
       headers: {
         'Accept': 'application/json',
+        ...(PROXY_SECRET ? { 'X-Proxy-Secret': PROXY_SECRET } : {}),
       },
     });
 